@@ -0,0 +1,36 @@
+# Configuration for running the app under gunicorn:
+#
+#     gunicorn -c gunicorn.conf.py showmanager.wsgi:app
+#
+# Settings are read from the "server" object of settings.json, which the
+# SHOWMANAGER_WORKERS, SHOWMANAGER_THREADS and SHOWMANAGER_BIND environment
+# variables override.
+
+import multiprocessing
+import os
+
+from showmanager.app import settings
+
+server = settings.get('server', {})
+
+bind = os.environ.get('SHOWMANAGER_BIND', server.get('bind', '127.0.0.1:8000'))
+
+# Worker processes, each serving several requests at once in threads
+workers = int(os.environ.get('SHOWMANAGER_WORKERS',
+                             server.get('workers',
+                                        multiprocessing.cpu_count() * 2 + 1)))
+threads = int(os.environ.get('SHOWMANAGER_THREADS',
+                             server.get('threads', 4)))
+worker_class = 'gthread'
+
+# Load and warm up the app once before forking, so workers start with
+# compiled templates and share the loaded code
+preload_app = True
+
+timeout = int(server.get('timeout', 60))
+
+
+def post_fork(server, worker):
+    # Database connections must not be shared between processes
+    from showmanager.app import db
+    db.engine.dispose()
@@ -1,13 +1,14 @@
 #!/usr/bin/env python3
+"""
+Run the development server. Use gunicorn.conf.py in production.
+"""
 
-import json
-from showmanager.views import app
+from showmanager.app import create_app
 
-# Load settings file    
-with open('settings.json') as fp:
-    settings = json.load(fp)
+# Chits are generated in processes that import this script again, so only
+# start the server when run directly
+if __name__ == '__main__':
+    app = create_app()
 
-app.secret_key = settings['secret_key']
-    
-# Run the flask app in debug mode
-app.run(debug=True)
+    # Run the flask app in debug mode
+    app.run(debug=True)
@@ -1,33 +1,188 @@
 
+import json
 import os
+import sqlite3
 import flask
-from flask_bootstrap import Bootstrap
-from flask_nav import Nav
-from flask_nav.elements import Navbar, View
 from flask_sqlalchemy import SQLAlchemy
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 #from flask.ext.login import LoginManager
 
 # Create the flask app
 app = flask.Flask(__name__)
 
-# Add bootstrap templates
-Bootstrap(app)
+# Serve bootstrap locally, once added by create_app
 app.config['BOOTSTRAP_SERVE_LOCAL'] = True
 
-# Create navbar
-nav = Nav()
-@nav.navigation()
-def topbar():
-    bar = Navbar('LeagueManager',
-                 View('Leagues', 'leagues'))
-    return bar
-nav.init_app(app)
-
-# Add the database
+# Load settings, which can be overridden by environment variables
 dirname = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+settings_file = os.environ.get('SHOWMANAGER_SETTINGS',
+                               os.path.join(dirname, 'settings.json'))
+try:
+    with open(settings_file) as fp:
+        settings = json.load(fp)
+except FileNotFoundError:
+    settings = {}
+
+# Database settings, with SQLite in write-ahead logging mode by default so
+# that readers never block the writer
 dbfile = os.path.join(dirname, 'test.db')
+DATABASE_DEFAULTS = {
+    'uri': 'sqlite:///' + dbfile,
+    'pool_size': None,
+    'max_overflow': None,
+    'pool_timeout': None,
+    'pool_recycle': None,
+    'timeout': 30,
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'cache_size': None,
+    'mmap_size': None,
+}
+
+def database_settings(settings, environ=os.environ):
+    """
+    Get the database settings.
+
+    Each setting is taken from the SHOWMANAGER_DATABASE_<NAME> environment
+    variable, then the "database" object in the settings file, then
+    DATABASE_DEFAULTS.
+
+    Parameters
+    ----------
+    settings : dict
+        The contents of the settings file
+    environ : dict, optional
+        The environment variables
+
+    Returns
+    -------
+    dict
+        The database settings
+    """
+    config = dict(DATABASE_DEFAULTS)
+    config.update(settings.get('database', {}))
+    for name in config:
+        variable = 'SHOWMANAGER_DATABASE_' + name.upper()
+        if variable in environ:
+            config[name] = environ[variable]
+    return config
+
+def pragma_value(value):
+    """
+    Check a pragma value is a plain number or keyword, safe to interpolate.
+    """
+    text = str(value)
+    if text.lstrip('-').isdigit():
+        return int(text)
+    if text.isalpha():
+        return text
+    raise ValueError('Invalid pragma value {!r}'.format(value))
 
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + dbfile
+def engine_options(config):
+    """
+    Get the SQLAlchemy engine options for the database settings.
+    """
+    options = {}
+    for name in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+        if config[name] is not None:
+            options[name] = int(config[name])
+    if config['uri'].startswith('sqlite'):
+        # Seconds to wait for another connection's lock before failing
+        options['connect_args'] = {'timeout': float(config['timeout'])}
+    return options
+
+database = database_settings(settings)
+
+app.config['SQLALCHEMY_DATABASE_URI'] = database['uri']
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(database)
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+app.config['SQLITE_PRAGMAS'] = {
+    name: pragma_value(database[name])
+    for name in ('journal_mode', 'synchronous', 'cache_size', 'mmap_size')
+    if database[name] is not None
+}
+
+@event.listens_for(Engine, 'connect')
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    Apply the configured pragmas to each new SQLite connection.
+    """
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in app.config['SQLITE_PRAGMAS'].items():
+        cursor.execute('PRAGMA {} = {}'.format(name, value))
+    cursor.close()
 
 db = SQLAlchemy(app)
+
+# Cache generated chits on disk
+app.config['CHIT_CACHE_DIR'] = os.path.join(dirname, 'chit_cache')
+app.config['CHIT_CACHE_SIZE'] = 100 * 1024 * 1024
+
+# Run reports in background threads
+app.config['JOB_WORKERS'] = 2
+app.config['JOB_TIMEOUT'] = 600
+
+# Write registrations in batches, waiting briefly for a batch to fill
+app.config['REGISTRATION_BATCH_SIZE'] = 50
+app.config['REGISTRATION_BATCH_WAIT'] = 0.05
+app.config['REGISTRATION_TIMEOUT'] = 10
+
+# Render the main pages once on startup before serving
+app.config['WARM_UP'] = True
+
+# Cache rendered results pages in memory, and optionally on disk to share
+# them between worker processes
+app.config['PAGE_CACHE_ENTRIES'] = 256
+app.config['PAGE_CACHE_DIR'] = None
+app.config['PAGE_CACHE_SIZE'] = 100 * 1024 * 1024
+app.config['PAGE_CACHE_WAIT'] = 10
+
+# Keep compiled templates on disk, so new processes need not recompile them
+app.config['JINJA_CACHE_DIR'] = os.path.join(dirname, 'jinja_cache')
+
+def create_app():
+    """
+    Set up the app for serving.
+
+    The views and the extensions used by the pages are registered here
+    rather than on import, so that command line tools do not pay for them.
+    The secret key is taken from the SHOWMANAGER_SECRET_KEY environment
+    variable or the settings file.
+
+    Returns
+    -------
+    Flask
+        The app
+    """
+    from flask_bootstrap import Bootstrap
+    from flask_nav import Nav
+    from flask_nav.elements import Navbar, View
+    from . import views
+
+    if 'bootstrap' not in app.extensions:
+
+        # Add bootstrap templates
+        Bootstrap(app)
+
+        # Create navbar
+        nav = Nav()
+        @nav.navigation()
+        def topbar():
+            bar = Navbar('LeagueManager',
+                         View('Leagues', 'leagues'))
+            return bar
+        nav.init_app(app)
+
+        if app.config['JINJA_CACHE_DIR']:
+            os.makedirs(app.config['JINJA_CACHE_DIR'], exist_ok=True)
+            app.jinja_env.bytecode_cache = \
+                FileSystemBytecodeCache(app.config['JINJA_CACHE_DIR'])
+
+    app.secret_key = os.environ.get('SHOWMANAGER_SECRET_KEY',
+                                    settings.get('secret_key'))
+
+    return app
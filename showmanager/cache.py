@@ -0,0 +1,126 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+def cache_key(*parts):
+    """
+    Hash the inputs that determine a generated file into a cache key.
+
+    Parameters
+    ----------
+    parts
+        Values identifying the file, which must have a stable repr
+
+    Returns
+    -------
+    str
+        The hex digest of the inputs
+    """
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()
+
+
+class FileCache(object):
+    """
+    A size-bounded on-disk cache of generated files, such as chits and
+    rendered pages.
+
+    Files are stored by key, and the least recently used files are removed
+    when the total size goes over the limit.
+
+    Parameters
+    ----------
+    directory : str
+        The directory to store cached files in
+    max_size : int, optional
+        The maximum total size of cached files, in bytes
+    """
+
+    def __init__(self, directory, max_size=100 * 1024 * 1024):
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+
+    def path(self, key):
+        """
+        Get the path a file is cached at.
+        """
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        """
+        Get the path of a cached file, marking it as recently used.
+
+        Returns
+        -------
+        str or None
+            The path to the file, or None if it is not cached
+        """
+        path = self.path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, write):
+        """
+        Store a file in the cache.
+
+        Parameters
+        ----------
+        key : str
+            The cache key of the file
+        write : callable
+            A function writing the file contents to the binary file object
+            it is passed
+
+        Returns
+        -------
+        str
+            The path to the cached file
+        """
+        os.makedirs(self.directory, exist_ok=True)
+
+        # Write to a temporary file first so that readers never see a
+        # partially written file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fp:
+                write(fp)
+            os.replace(tmp, self.path(key))
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        self.evict()
+
+        return self.path(key)
+
+    def evict(self):
+        """
+        Remove the least recently used files until under the size limit.
+        """
+        with self.lock:
+
+            files = []
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.tmp'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in files)
+
+            for _, size, path in sorted(files):
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
@@ -1,14 +1,19 @@
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 from io import BytesIO
+from multiprocessing import get_context
+import os
+from tempfile import TemporaryDirectory
+from zipfile import ZipFile
 
-from reportlab.lib.pagesizes import A4, A6
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.enums import TA_RIGHT
+from .imposition import LAYOUTS
 
-from .tiledcanvas import TiledCanvas
-from .util import MARGIN, WIDTH, frame, frame_add_text, draw_hline, draw_box
+# The details of an entry needed for its chits, which unlike Entry objects
+# can be sent to other processes
+ChitEntry = namedtuple('ChitEntry', ['number', 'handler', 'dog', 'hraj1'])
 
 
-def chits(class_names, entries, tiled=False):
+def chits(class_names, entries, tiled=False, layout=None, cut_marks=False):
     """
     Generate a PDF of the chits for a set of classes.
 
@@ -20,13 +25,57 @@ def chits(class_names, entries, tiled=False):
         A list of Entry objects that chits are to be generated for
     tiled : bool, optional
         Set to True to generate A4 PDFs with the chits tiled
+    layout : str, optional
+        The name of the sheet layout in LAYOUTS, overriding tiled
+    cut_marks : bool, optional
+        Set to True to draw cut marks around the chits
     """
 
     # Set up string stream to hold data
     stream = BytesIO()
 
+    write_chits(stream, class_names, entries, tiled, layout, cut_marks)
+
+    # Get PDF file data
+    data = stream.getvalue()
+    stream.close()
+
+    # Return PDF data
+    return data
+
+
+def write_chits(output, class_names, entries, tiled=False, layout=None,
+                cut_marks=False):
+    """
+    Write a PDF of the chits for a set of classes to a file.
+
+    Parameters
+    ----------
+    output : str or file-like
+        The file name or binary file object to write the PDF to
+    class_names : list
+        A list of the names of the classes to generate chits for
+    entries : list
+        A list of Entry objects that chits are to be generated for
+    tiled : bool, optional
+        Set to True to generate A4 PDFs with the chits tiled
+    layout : str, optional
+        The name of the sheet layout in LAYOUTS, overriding tiled
+    cut_marks : bool, optional
+        Set to True to draw cut marks around the chits
+    """
+
+    # reportlab is slow to import, so is only imported once chits are drawn
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.enums import TA_RIGHT
+    from .tiledcanvas import TiledCanvas
+    from .util import MARGIN, frame, frame_add_text
+
     # Prepare Canvas
-    canvas = TiledCanvas(stream, pagesize=A4 if tiled else A6)
+    if layout is None:
+        layout = 'a4' if tiled else 'a6'
+    canvas = TiledCanvas(output, imposition=LAYOUTS[layout],
+                         cut_marks=cut_marks)
     canvas.setTitle('Generated Chits')
 
     # Prepare Font Styles
@@ -47,18 +96,26 @@ def chits(class_names, entries, tiled=False):
     right10.leading = 14
     styles.add(right10)
 
+    # Draw the parts of the chit common to every entry once, as a form
+    canvas.beginForm('chit')
+    draw_template(canvas, styles)
+    canvas.endForm()
+
+    # Frame height should be single line height
+    hnormal = styles['Normal'].leading
+
     # Loop over the class names
     for name in class_names:
 
         # Loop over all entries
         for entry in entries:
 
+            # Add the common parts of the chit
+            canvas.doForm('chit')
+
             # Start at margin
             vpos = MARGIN
 
-            # Frame height should be single line height
-            hnormal = styles['Normal'].leading
-
             # First row, add dog number and class name
             f = frame(canvas, vpos, hnormal, horizontal=(0, 0.5))
             frame_add_text(canvas, f, 'Dog No: {}'.format(entry.number),
@@ -67,10 +124,8 @@ def chits(class_names, entries, tiled=False):
             frame_add_text(canvas, f, name, styles['Right'])
             vpos += hnormal
 
-            # Add a divider
-            vpos += 4
-            draw_hline(canvas, A6[1] - vpos)
-            vpos += 4
+            # Skip the divider
+            vpos += 8
 
             # Second row, add the handler
             f = frame(canvas, vpos, hnormal)
@@ -86,45 +141,158 @@ def chits(class_names, entries, tiled=False):
             # Extra info
             f = frame(canvas, vpos, hnormal, horizontal=(0.75, 1))
             frame_add_text(canvas, f, entry.hraj1, styles['Right'])
-            vpos += hnormal
-
-            # Add abit of space
-            vpos += 20
 
-            # Draw scoring boxes
-            box_height = 40
-            pad = (box_height - styles['Right12'].leading) / 2.
-            for i, text in enumerate(['DOG\'S TIME', 'COURSE TIME',
-                                      'TIME FAULTS', 'JUMPING FAULTS']):
+            canvas.showPage()
 
-                # Add a box label
-                f = frame(canvas, vpos, box_height, horizontal=(0, 0.7),
-                          vpad=pad, hpad=10)
-                frame_add_text(canvas, f, text, styles['Right12'])
+    canvas.save()
 
-                # Add score box
-                draw_box(canvas, MARGIN + WIDTH * 0.7, MARGIN + WIDTH,
-                         A6[1] - vpos, A6[1] - vpos - box_height)
 
-                vpos += box_height
+def chits_zip(class_names, entries, tiled=False, layout=None,
+              cut_marks=False, processes=None):
+    """
+    Generate a ZIP archive of chit PDFs, one per class, in parallel.
 
-            # Move to bottom
-            vpos = A6[1] - 30 - box_height
-            f = frame(canvas, vpos, box_height, horizontal=(0, 0.7),
-                      vpad=pad, hpad=10)
-            # Add a box label
-            frame_add_text(canvas, f, 'TOTAL FAULTS', styles['Right12'])
-            # Add score box
-            draw_box(canvas, MARGIN + WIDTH * 0.7, MARGIN + WIDTH,
-                     A6[1] - vpos, A6[1] - vpos - box_height)
+    Parameters
+    ----------
+    class_names : list
+        A list of the names of the classes to generate chits for
+    entries : list
+        A list of Entry objects that chits are to be generated for
+    tiled : bool, optional
+        Set to True to generate A4 PDFs with the chits tiled
+    layout : str, optional
+        The name of the sheet layout in LAYOUTS, overriding tiled
+    cut_marks : bool, optional
+        Set to True to draw cut marks around the chits
+    processes : int, optional
+        The number of worker processes, defaults to the number of CPUs
+    """
 
-            canvas.showPage()
+    # Set up string stream to hold data
+    stream = BytesIO()
 
-    canvas.save()
+    write_chits_zip(stream, class_names, entries, tiled, layout, cut_marks,
+                    processes)
 
-    # Get PDF file data
+    # Get ZIP file data
     data = stream.getvalue()
     stream.close()
 
-    # Return PDF data
+    # Return ZIP data
     return data
+
+
+def write_chits_zip(output, class_names, entries, tiled=False, layout=None,
+                    cut_marks=False, processes=None):
+    """
+    Write a ZIP archive of chit PDFs, one per class, generated in parallel.
+
+    Parameters
+    ----------
+    output : str or file-like
+        The file name or binary file object to write the archive to
+    class_names : list
+        A list of the names of the classes to generate chits for
+    entries : list
+        A list of Entry objects that chits are to be generated for
+    tiled : bool, optional
+        Set to True to generate A4 PDFs with the chits tiled
+    layout : str, optional
+        The name of the sheet layout in LAYOUTS, overriding tiled
+    cut_marks : bool, optional
+        Set to True to draw cut marks around the chits
+    processes : int, optional
+        The most worker processes to use, defaults to the number of CPUs
+    """
+
+    entries = [ChitEntry(e.number, e.handler, e.dog, e.hraj1)
+               for e in entries]
+
+    # No more workers than there are classes to generate
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(len(class_names), processes))
+
+    # Start the workers from a server process rather than forking the web
+    # worker, with its threads and database connections. Each worker imports
+    # the main script again, so scripts calling this need a main guard.
+    context = get_context('forkserver')
+
+    with TemporaryDirectory() as tmpdir:
+
+        # Leaving the executor waits for the workers, even if one failed, so
+        # none are still writing to the directory when it is removed
+        with ProcessPoolExecutor(processes, mp_context=context) as executor, \
+                ZipFile(output, 'w') as archive:
+
+            # Generate each class in a separate process, writing to a
+            # temporary file rather than sending the PDF data back
+            paths = [os.path.join(tmpdir, '{}.pdf'.format(i))
+                     for i in range(len(class_names))]
+            futures = [executor.submit(write_chits, path, [name], entries,
+                                       tiled, layout, cut_marks)
+                       for path, name in zip(paths, class_names)]
+
+            for name, path, future in zip(class_names, paths, futures):
+                future.result()
+                filename = '{}.pdf'.format(name.replace('/', '-'))
+                archive.write(path, filename)
+                os.remove(path)
+
+
+def draw_template(canvas, styles):
+    """
+    Draw the parts of a chit that are the same for every entry.
+
+    Parameters
+    ----------
+    canvas : TiledCanvas
+        The canvas to draw on
+    styles : StyleSheet1
+        The text styles to use
+    """
+    from .util import MARGIN, frame, frame_add_text, draw_hline, draw_box
+
+    # Geometry of a single chit
+    tile_height = canvas.tilesize[1]
+    width = canvas.tilesize[0] - 2 * MARGIN
+
+    # Skip the first row
+    hnormal = styles['Normal'].leading
+    vpos = MARGIN + hnormal
+
+    # Add a divider
+    vpos += 4
+    draw_hline(canvas, tile_height - vpos)
+    vpos += 4
+
+    # Skip the handler and dog rows, and add abit of space
+    vpos += 2 * hnormal
+    vpos += 20
+
+    # Draw scoring boxes
+    box_height = 40
+    pad = (box_height - styles['Right12'].leading) / 2.
+    for i, text in enumerate(['DOG\'S TIME', 'COURSE TIME',
+                              'TIME FAULTS', 'JUMPING FAULTS']):
+
+        # Add a box label
+        f = frame(canvas, vpos, box_height, horizontal=(0, 0.7),
+                  vpad=pad, hpad=10)
+        frame_add_text(canvas, f, text, styles['Right12'])
+
+        # Add score box
+        draw_box(canvas, MARGIN + width * 0.7, MARGIN + width,
+                 tile_height - vpos, tile_height - vpos - box_height)
+
+        vpos += box_height
+
+    # Move to bottom
+    vpos = tile_height - 30 - box_height
+    f = frame(canvas, vpos, box_height, horizontal=(0, 0.7),
+              vpad=pad, hpad=10)
+    # Add a box label
+    frame_add_text(canvas, f, 'TOTAL FAULTS', styles['Right12'])
+    # Add score box
+    draw_box(canvas, MARGIN + width * 0.7, MARGIN + width,
+             tile_height - vpos, tile_height - vpos - box_height)
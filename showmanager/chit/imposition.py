@@ -0,0 +1,179 @@
+# Sheet sizes in points, as in reportlab.lib.pagesizes, which is not
+# imported so that layouts can be looked up without loading reportlab
+inch = 72.0
+mm = inch / 2.54 * 0.1
+
+A6 = (105 * mm, 148 * mm)
+A4 = (210 * mm, 297 * mm)
+A3 = (297 * mm, 420 * mm)
+letter = (8.5 * inch, 11 * inch)
+
+# Allowance for rounding in page sizes given in millimetres
+FUZZ = 1e-6
+
+
+def landscape(pagesize):
+    """
+    Get the landscape orientation of a sheet size.
+    """
+    width, height = pagesize
+    return (max(width, height), min(width, height))
+
+
+class Imposition(object):
+    """
+    The arrangement of equally sized tiles on a sheet.
+
+    Tiles are laid out in a grid, filled row by row from the top left. The
+    sheet is turned to landscape if that fits more tiles on it.
+
+    Parameters
+    ----------
+    sheet : tuple
+        The size, in points, of the sheet
+    tile : tuple, optional
+        The size, in points, of each tile (defaults to A6)
+    margin : float, optional
+        The minimum space, in points, between the tiles and the sheet edge
+    gutter : float, optional
+        The space, in points, between adjacent tiles
+    center : bool, optional
+        Set to True to centre the grid on the sheet, rather than placing it
+        in the bottom left corner
+    """
+
+    def __init__(self, sheet, tile=A6, margin=0, gutter=0, center=False):
+
+        self.tile = tile
+        self.margin = margin
+        self.gutter = gutter
+
+        # Use whichever orientation of the sheet fits the most tiles
+        portrait = self.grid(sheet)
+        rotated = self.grid(landscape(sheet))
+        if rotated[0] * rotated[1] > portrait[0] * portrait[1]:
+            self.pagesize = landscape(sheet)
+            self.columns, self.rows = rotated
+        else:
+            self.pagesize = tuple(sheet)
+            self.columns, self.rows = portrait
+
+        if self.columns < 1 or self.rows < 1:
+            raise ValueError('tile does not fit on sheet')
+
+        # Position the grid
+        width, height = self.extent()
+        if center:
+            self.x0 = (self.pagesize[0] - width) / 2.
+            self.y0 = (self.pagesize[1] - height) / 2.
+        else:
+            self.x0 = margin
+            self.y0 = margin
+
+        # Tile origins, top row first
+        self.tiles = [(self.x0 + col * (tile[0] + gutter),
+                       self.y0 + row * (tile[1] + gutter))
+                      for row in reversed(range(self.rows))
+                      for col in range(self.columns)]
+
+    def grid(self, sheet):
+        """
+        Count the columns and rows of tiles fitting on a sheet.
+
+        Returns
+        -------
+        tuple
+            The number of columns and rows
+        """
+        def count(available, size):
+            return int((available - 2 * self.margin + self.gutter + FUZZ) //
+                       (size + self.gutter))
+        return count(sheet[0], self.tile[0]), count(sheet[1], self.tile[1])
+
+    def extent(self):
+        """
+        Get the size of the grid of tiles.
+
+        Returns
+        -------
+        tuple
+            The width and height, in points
+        """
+        return (self.columns * (self.tile[0] + self.gutter) - self.gutter,
+                self.rows * (self.tile[1] + self.gutter) - self.gutter)
+
+    def __len__(self):
+        return len(self.tiles)
+
+    def cut_lines(self):
+        """
+        Get the positions of the edges of the tiles.
+
+        Returns
+        -------
+        tuple
+            Sorted lists of the x and y coordinates of the tile edges
+        """
+        xs = set()
+        ys = set()
+        for x, y in self.tiles:
+            xs.update([x, x + self.tile[0]])
+            ys.update([y, y + self.tile[1]])
+        return sorted(xs), sorted(ys)
+
+    def draw_cut_marks(self, canvas, length=12, offset=3):
+        """
+        Draw marks in the space around the grid showing where to cut.
+
+        Marks are only drawn where there is room for them between the grid
+        and the sheet edge.
+
+        Parameters
+        ----------
+        canvas : Canvas
+            The reportlab canvas to draw on
+        length : float, optional
+            The maximum length of each mark, in points
+        offset : float, optional
+            The space left between the grid and each mark, in points
+        """
+        width, height = self.extent()
+        left, bottom = self.x0, self.y0
+        right, top = left + width, bottom + height
+
+        xs, ys = self.cut_lines()
+        lines = []
+
+        # Vertical marks below and above the grid
+        below = min(length, bottom - offset)
+        above = min(length, self.pagesize[1] - top - offset)
+        for x in xs:
+            if below > 0:
+                lines.append((x, bottom - offset - below, x, bottom - offset))
+            if above > 0:
+                lines.append((x, top + offset, x, top + offset + above))
+
+        # Horizontal marks left and right of the grid
+        before = min(length, left - offset)
+        after = min(length, self.pagesize[0] - right - offset)
+        for y in ys:
+            if before > 0:
+                lines.append((left - offset - before, y, left - offset, y))
+            if after > 0:
+                lines.append((right + offset, y, right + offset + after, y))
+
+        if lines:
+            canvas.saveState()
+            canvas.setLineWidth(0.25)
+            canvas.lines(lines)
+            canvas.restoreState()
+
+
+# Named sheet layouts for A6 chits. A4 and A3 are filled exactly, so have no
+# room around the chits for cut marks.
+LAYOUTS = {
+    'a6': Imposition(A6),
+    'a4': Imposition(A4),                             # 4-up
+    'a3': Imposition(A3),                             # 8-up, landscape
+    'letter': Imposition(letter, center=True),        # 2-up
+}
@@ -1,5 +1,7 @@
 from reportlab.pdfgen.canvas import Canvas
-from reportlab.lib.pagesizes import A4, A6
+from reportlab.lib.pagesizes import A6
+
+from .imposition import Imposition
 
 
 class TiledCanvas(object):
@@ -11,28 +13,35 @@ class TiledCanvas(object):
     stream : file-like
         A file-like object that the canvas will write to
     pagesize : tuple, optional
-        The size, in points, of the page canvas (defaults to A6)
+        The size, in points, of the page canvas (defaults to A6), which is
+        tiled with A6 chits
+    imposition : Imposition, optional
+        The arrangement of tiles on each page, used instead of pagesize
+    cut_marks : bool, optional
+        Set to True to draw cut marks around the tiles on each page
     """
 
-    def __init__(self, stream, pagesize=A6):
+    def __init__(self, stream, pagesize=A6, imposition=None,
+                 cut_marks=False):
+
+        if imposition is None:
+            imposition = Imposition(pagesize)
 
         # Initialise the canvas
-        self.canvas = Canvas(stream, pagesize=pagesize)
+        self.canvas = Canvas(stream, pagesize=imposition.pagesize)
 
         # Store some alignment information for the tiling
-        if pagesize == A6:
-            self.tiles = [(0, 0)]
-        elif pagesize == A4:
-            self.tiles = [(0,     A6[1]),
-                          (A6[0], A6[1]),
-                          (0,     0),
-                          (A6[0], 0)]
-        else:
-            raise ValueError('pagesize not supported')
+        self.imposition = imposition
+        self.tiles = imposition.tiles
+        self.tilesize = imposition.tile
+        self.cut_marks = cut_marks
 
         # Initialise current position
         self.current_tile = 0
 
+        # Forms are drawn relative to the tile origin when used
+        self.defining_form = False
+
     def __getattr__(self, attr):
         """
         Map any undefined methods on to the underlying canvas object.
@@ -51,11 +60,27 @@ class TiledCanvas(object):
         if self.current_tile == len(self.tiles):
 
             # Move to new page
+            self.finish_page()
             self.canvas.showPage()
 
             # Reset tile counter
             self.current_tile = 0
 
+    def save(self):
+        """
+        Finish any partly filled page and save the document.
+        """
+        if self.current_tile > 0:
+            self.finish_page()
+        self.canvas.save()
+
+    def finish_page(self):
+        """
+        Add the marks common to every page.
+        """
+        if self.cut_marks:
+            self.imposition.draw_cut_marks(self.canvas)
+
     def origin(self):
         """
         Get the origin of the current tile.
@@ -65,8 +90,44 @@ class TiledCanvas(object):
         tuple
             The origin, in points
         """
+        if self.defining_form:
+            return (0, 0)
         return self.tiles[self.current_tile]
 
+    def beginForm(self, name):
+        """
+        Start drawing a reusable form the size of a single tile.
+
+        Parameters
+        ----------
+        name : str
+            The name to refer to the form by
+        """
+        self.canvas.beginForm(name, 0, 0, self.tilesize[0], self.tilesize[1])
+        self.defining_form = True
+
+    def endForm(self):
+        """
+        Finish drawing a form started with beginForm.
+        """
+        self.canvas.endForm()
+        self.defining_form = False
+
+    def doForm(self, name):
+        """
+        Draw a form on the current tile.
+
+        Parameters
+        ----------
+        name : str
+            The name of the form
+        """
+        x0, y0 = self.origin()
+        self.canvas.saveState()
+        self.canvas.translate(x0, y0)
+        self.canvas.doForm(name)
+        self.canvas.restoreState()
+
 
 class TiledCanvasPath(object):
     """
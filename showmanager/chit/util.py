@@ -1,4 +1,6 @@
-from reportlab.lib.pagesizes import A6
+import functools
+
+from reportlab.pdfbase.pdfmetrics import stringWidth
 from reportlab.platypus import Paragraph, Frame
 from reportlab.lib.styles import ParagraphStyle
 
@@ -6,7 +8,6 @@ from .tiledcanvas import TiledCanvasPath
 
 # Define some constants
 MARGIN = 30
-WIDTH = A6[0] - 2 * MARGIN  # Content width
 
 
 def frame(canvas, top, height=30, horizontal=(0, 1), vpad=0, hpad=0):
@@ -31,20 +32,77 @@ def frame(canvas, top, height=30, horizontal=(0, 1), vpad=0, hpad=0):
     x0, y0 = canvas.origin()
 
     # Caclulate the available width
-    width = A6[0] - (2 * MARGIN)
+    tile_width, tile_height = canvas.tilesize
+    width = tile_width - (2 * MARGIN)
 
     # Calculate the start and width of the frame
     x1 = x0 + MARGIN + width * horizontal[0]
     dx = width * (horizontal[1] - horizontal[0])
 
     # Create and return the frame instance
-    frame = Frame(x1, y0 + A6[1] - top - height, dx, height,
+    frame = Frame(x1, y0 + tile_height - top - height, dx, height,
                   topPadding=vpad, bottomPadding=vpad,
                   leftPadding=hpad, rightPadding=hpad)
 
     return frame
 
 
+@functools.lru_cache(maxsize=4096)
+def fit_scale(text, font_name, font_size, leading, width, height):
+    """
+    Find the factor to scale a font by for text to fit in a space.
+
+    Parameters
+    ----------
+    text : str
+        The text to be written
+    font_name : str
+        The name of the font
+    font_size : float
+        The unscaled font size
+    leading : float
+        The unscaled line spacing
+    width : float
+        The available width
+    height : float
+        The available height
+
+    Returns
+    -------
+    float
+        The scale factor, at most 1
+    """
+
+    def fits(scale):
+        style = ParagraphStyle(name='fit', fontName=font_name,
+                               fontSize=font_size * scale,
+                               leading=leading * scale)
+        return Paragraph(text, style).wrap(width, height)[1] <= height
+
+    if fits(1.):
+        return 1.
+
+    # Estimate the scale needed to fit the text on a single line from the
+    # font metrics
+    text_width = stringWidth(text, font_name, font_size)
+    estimate = min(1., width / text_width if text_width else 1.,
+                   height / leading)
+
+    # Wrapped over several lines, the text may fit at a larger size than the
+    # estimate, so search for the largest scale that fits
+    if fits(estimate):
+        lower, upper = estimate, 1.
+    else:
+        lower, upper = 0., estimate
+    for i in range(12):
+        middle = (lower + upper) / 2.
+        if fits(middle):
+            lower = middle
+        else:
+            upper = middle
+    return lower
+
+
 def frame_add_text(canvas, frame, text, style):
     """
     Add text to a frame, automatically reducing the font size until it fits.
@@ -61,13 +119,19 @@ def frame_add_text(canvas, frame, text, style):
         The text style to use
     """
 
+    # Size the font to fit the space available in the frame
+    scale = fit_scale(text, style.fontName, style.fontSize, style.leading,
+                      frame._aW, frame._aH)
+
     # Initialise a child style
-    mystyle = ParagraphStyle(name='custom', parent=style)
+    mystyle = ParagraphStyle(name='custom', parent=style,
+                             fontSize=style.fontSize * scale,
+                             leading=style.leading * scale)
 
     # Prepare the content
     content = Paragraph(text, mystyle)
 
-    # Try to add the text to the frame, reducing font size until it works
+    # Add the text to the frame, reducing font size further if still needed
     while not frame.add(content, canvas):
         mystyle.fontSize *= 0.99
         mystyle.leading *= 0.99
@@ -90,7 +154,7 @@ def draw_hline(canvas, y):
     # Move to starting position
     path.moveTo(MARGIN, y)
     # Draw to end positon
-    path.lineTo(A6[0] - MARGIN, y)
+    path.lineTo(canvas.tilesize[0] - MARGIN, y)
     # Draw the page
     path.draw()
 
@@ -2,6 +2,7 @@
 from urllib.parse import urlparse, urljoin
 from flask import request, url_for, redirect
 from flask_wtf import Form
+import wtforms
 from wtforms import (BooleanField, StringField, IntegerField, SubmitField,
                      SelectField, HiddenField, validators)
 from wtforms.fields.html5 import DateField, DateTimeField
@@ -118,7 +119,10 @@ def league_form(league):
 
     return LeagueForm
 
-class EntryForm(Form):
+class EntryFields(object):
+    """
+    The details of an entry, shared by registration and bulk imports.
+    """
     handler = StringField('Handler', [validators.InputRequired()])
     dog     = StringField('Dog',     [validators.InputRequired()])
     size    = SelectField('Size', [validators.InputRequired()],
@@ -130,4 +134,23 @@ class EntryForm(Form):
     rescue = BooleanField('Rescue Dog')
     abc    = BooleanField('Anything But Collies')
     junior = BooleanField('Junior Handler')
+
+    def entry_values(self):
+        """
+        Get the column values of the entry described by the form.
+        """
+        return {'handler': self.handler.data,
+                'dog': self.dog.data,
+                'size': self.size.data,
+                'grade': self.grade.data,
+                'rescue': self.rescue.data,
+                'collie': not self.abc.data,
+                'junior': self.junior.data}
+
+class EntryForm(Form, EntryFields):
     submit  = SubmitField()
+
+class EntryRecordForm(wtforms.Form, EntryFields):
+    """
+    Validates one record of a bulk entry import, without CSRF protection.
+    """
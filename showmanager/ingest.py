@@ -0,0 +1,377 @@
+import csv
+from datetime import datetime
+import json
+import math
+from numbers import Real
+import os
+
+from sqlalchemy import and_
+from sqlalchemy.dialects import postgresql, sqlite
+from werkzeug.datastructures import MultiDict
+
+from .app import db
+from .forms import EntryRecordForm
+from .models import League, Entry, Score, mark_points_stale
+
+# Formats entries can be imported from, by file extension
+ENTRY_FORMATS = {
+    '.csv': 'csv',
+    '.json': 'json',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+}
+
+# Insert constructs of the databases that can upsert scores
+UPSERT_DIALECTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+# Values of the yes/no fields of imported entries that mean no
+FALSE_VALUES = ('', '0', 'false', 'f', 'no', 'n')
+
+
+class IngestError(ValueError):
+    """
+    Raised when a batch of records fails validation.
+
+    Parameters
+    ----------
+    errors : list
+        A dict for each problem found, giving the index of the record and
+        the error message
+    """
+
+    def __init__(self, errors):
+        message = '{} invalid records'.format(len(errors))
+        super(IngestError, self).__init__(message)
+        self.errors = errors
+
+
+def validate_scores(course, records):
+    """
+    Check a batch of score records for a course.
+
+    Each record is a dict with the entry number, and either eliminated set
+    to true or the number of jumping faults and the time.
+
+    Parameters
+    ----------
+    course : Course
+        The course the scores are for
+    records : list
+        The score records
+
+    Returns
+    -------
+    list
+        A dict of column values for each score
+
+    Raises
+    ------
+    IngestError
+        If any of the records are invalid
+    """
+
+    errors = []
+
+    def error(index, message):
+        errors.append({'index': index, 'error': message})
+
+    def valid_number(record):
+        number = record.get('number')
+        return isinstance(number, int) and not isinstance(number, bool)
+
+    # Look up the entries of the whole batch at once
+    numbers = [record['number'] for record in records
+               if isinstance(record, dict) and valid_number(record)]
+    entries = dict(db.session.query(Entry.number, Entry.id)
+                             .filter(Entry.league_id == course.round.league_id)
+                             .filter(Entry.number.in_(numbers)))
+
+    rows = []
+    seen = set()
+
+    for i, record in enumerate(records):
+
+        if not isinstance(record, dict):
+            error(i, 'Record is not an object')
+            continue
+
+        number = record.get('number')
+        if not valid_number(record) or number not in entries:
+            error(i, 'No entry numbered {!r}'.format(number))
+            continue
+        if number in seen:
+            error(i, 'Duplicate score for entry {}'.format(number))
+            continue
+        seen.add(number)
+
+        eliminated = record.get('eliminated', False)
+        faults = record.get('faults')
+        time = record.get('time')
+
+        if not isinstance(eliminated, bool):
+            error(i, 'Eliminated must be true or false')
+            continue
+
+        if not eliminated:
+            if isinstance(faults, bool) or not isinstance(faults, int) \
+                    or faults < 0:
+                error(i, 'Faults must be a non-negative integer')
+                continue
+            if isinstance(time, bool) or not isinstance(time, Real) \
+                    or not math.isfinite(time) or time < 0:
+                error(i, 'Time must be a non-negative number')
+                continue
+
+        rows.append({'course_id': course.id,
+                     'entry_id': entries[number],
+                     'faults': None if eliminated else faults,
+                     'time': None if eliminated else float(time),
+                     'eliminated': eliminated})
+
+    if errors:
+        raise IngestError(errors)
+
+    return rows
+
+
+def upsert_scores(course, rows, now=None):
+    """
+    Insert or replace a batch of scores for a course.
+
+    PostgreSQL and SQLite upsert the batch in one statement. Other databases
+    delete any existing scores for the entries and insert the batch.
+
+    The session is not committed. Points for the course are recomputed once
+    for the whole batch when it is.
+
+    Parameters
+    ----------
+    course : Course
+        The course the scores are for
+    rows : list
+        Column values for each score, as returned by validate_scores
+    now : datetime, optional
+        The time to record the scores as modified at
+    """
+
+    if not rows:
+        return
+
+    if now is None:
+        now = datetime.now()
+
+    # Core statements skip the ORM onupdate, so set the timestamps here
+    rows = [dict(row, created=now, modified=now) for row in rows]
+
+    table = Score.__table__
+    insert = UPSERT_DIALECTS.get(db.engine.dialect.name)
+    if insert is not None:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Score.course_id, Score.entry_id],
+            set_={'faults': stmt.excluded.faults,
+                  'time': stmt.excluded.time,
+                  'eliminated': stmt.excluded.eliminated,
+                  'modified': stmt.excluded.modified})
+        db.session.execute(stmt, rows)
+    else:
+        # Without an upsert, replace the existing scores in the same
+        # transaction, keeping the time they were first created
+        existing = [table.c.course_id == course.id,
+                    table.c.entry_id.in_([row['entry_id'] for row in rows])]
+        created = dict(db.session.query(table.c.entry_id, table.c.created)
+                                 .filter(*existing))
+        for row in rows:
+            row['created'] = created.get(row['entry_id'], now)
+        db.session.execute(table.delete().where(and_(*existing)))
+        db.session.execute(table.insert(), rows)
+
+    # Scores already loaded hold their old values
+    for obj in list(db.session.identity_map.values()):
+        if isinstance(obj, Score) and obj.course_id == course.id:
+            db.session.expire(obj)
+
+    mark_points_stale(db.session, courses=[course.id])
+
+
+def entries_format(filename):
+    """
+    Get the format of an entries file from its extension.
+
+    Raises
+    ------
+    ValueError
+        If the format is not supported
+    """
+    extension = os.path.splitext(filename)[1].lower()
+    try:
+        return ENTRY_FORMATS[extension]
+    except KeyError:
+        raise ValueError('Entries must be imported from a CSV, JSON or '
+                         'JSON lines file')
+
+
+def read_records(fp, format):
+    """
+    Read records one at a time from a text file.
+
+    Parameters
+    ----------
+    fp : file-like
+        The text file to read
+    format : str
+        'csv' for a header row and a row per record, 'json' for a list of
+        objects, or 'jsonl' for an object per line
+
+    Returns
+    -------
+    iterable
+        The records, with None in place of any lines that are not valid JSON
+
+    Raises
+    ------
+    ValueError
+        If a JSON file is not valid JSON or does not hold a list
+    """
+
+    def parse(line):
+        try:
+            return json.loads(line)
+        except ValueError:
+            return None
+
+    if format == 'csv':
+        return csv.DictReader(fp)
+    elif format == 'json':
+        records = json.load(fp)
+        if not isinstance(records, list):
+            raise ValueError('A JSON file of entries must be a list of '
+                             'objects')
+        return iter(records)
+    elif format == 'jsonl':
+        return (parse(line) for line in fp if line.strip())
+    raise ValueError('Unknown format {!r}'.format(format))
+
+
+def entry_formdata(record):
+    """
+    Convert an imported entry record to data for an EntryRecordForm.
+    """
+    data = MultiDict()
+    for name, value in record.items():
+        if value is None:
+            continue
+        value = str(value).strip()
+        if name in ('rescue', 'abc', 'junior'):
+            # Leave out unticked boxes, as a browser would
+            if value.lower() in FALSE_VALUES:
+                continue
+            value = 'y'
+        data.add(name, value)
+    return data
+
+
+def import_entries(league, records, batch_size=500):
+    """
+    Validate and insert entries into a league in batches.
+
+    Records are dicts with the fields of forms.EntryRecordForm and are
+    validated the same way as registrations. The session is not committed;
+    if an IngestError is raised earlier batches may have been inserted, so
+    the session should be rolled back.
+
+    Parameters
+    ----------
+    league : League
+        The league to enter
+    records : iterable
+        The entry records
+    batch_size : int, optional
+        The number of entries to insert in each statement
+
+    Returns
+    -------
+    int
+        The number of entries imported
+
+    Raises
+    ------
+    IngestError
+        If any of the records are invalid
+    """
+
+    errors = []
+    batch = []
+    count = 0
+
+    def insert():
+        # Once a record is invalid only validate the rest, to report all
+        # the problems together
+        if batch and not errors:
+            db.session.execute(Entry.__table__.insert(), batch)
+        del batch[:]
+
+    for i, record in enumerate(records):
+
+        if not isinstance(record, dict):
+            errors.append({'index': i, 'error': 'Record is not an object'})
+            continue
+
+        form = EntryRecordForm(entry_formdata(record))
+        if not form.validate():
+            message = '; '.join('{}: {}'.format(name, ' '.join(messages))
+                                for name, messages
+                                in sorted(form.errors.items()))
+            errors.append({'index': i, 'error': message})
+            continue
+
+        batch.append(dict(form.entry_values(), league_id=league.id))
+        count += 1
+
+        if len(batch) >= batch_size:
+            insert()
+
+    insert()
+
+    if errors:
+        raise IngestError(errors)
+
+    # Entries change the points available on every course of the league
+    league.last_entry = datetime.utcnow()
+    mark_points_stale(db.session, leagues=[league.id])
+
+    return count
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) != 3:
+        print('usage: python -m showmanager.ingest LEAGUE_ID FILE')
+        sys.exit(1)
+
+    league = League.query.get(int(sys.argv[1]))
+    if league is None:
+        print('No league with id {}'.format(sys.argv[1]))
+        sys.exit(1)
+
+    filename = sys.argv[2]
+    try:
+        with open(filename, encoding='utf-8-sig', newline='') as fp:
+            records = read_records(fp, entries_format(filename))
+            count = import_entries(league, records)
+    except IngestError as e:
+        db.session.rollback()
+        for error in e.errors:
+            print('Record {}: {}'.format(error['index'] + 1, error['error']))
+        sys.exit(1)
+    except ValueError as e:
+        db.session.rollback()
+        print(e)
+        sys.exit(1)
+
+    db.session.commit()
+    print('Imported {} entries into {}'.format(count, league.name))
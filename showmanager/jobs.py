@@ -0,0 +1,137 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from .app import app, db
+from .models import Job
+
+
+# Functions run by each kind of job
+tasks = {}
+
+executor = ThreadPoolExecutor(max_workers=app.config['JOB_WORKERS'])
+submit_lock = threading.Lock()
+
+
+def task(kind):
+    """
+    Register a function to be run by jobs of a kind.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of job
+    """
+    def decorator(func):
+        tasks[kind] = func
+        return func
+    return decorator
+
+
+def active_job(key):
+    """
+    Get the job queued or running to produce an output, if there is one.
+    """
+    return Job.query.filter(Job.key == key) \
+                    .filter(Job.status.in_(['queued', 'running'])) \
+                    .first()
+
+
+def submit(kind, key, url, *args):
+    """
+    Queue a job to run in the background.
+
+    If an identical job is already queued or running, that job is returned
+    instead of starting another.
+
+    Parameters
+    ----------
+    kind : str
+        The kind of job
+    key : str
+        Identifies the output of the job
+    url : str
+        Where to find the output once the job is done
+    args
+        Arguments to the task function
+
+    Returns
+    -------
+    Job
+        The job producing the output
+    """
+
+    with submit_lock:
+
+        job = active_job(key)
+        if job is not None and expire(job).in_progress:
+            return job
+
+        job = Job(key=key, kind=kind, url=url)
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Another process queued the same job first
+            db.session.rollback()
+            job = active_job(key)
+            if job is None:
+                raise
+            return job
+
+    executor.submit(run, job.id, args)
+
+    return job
+
+
+def expire(job):
+    """
+    Fail a job that has been in progress for longer than JOB_TIMEOUT.
+
+    Jobs run in threads of the process that queued them, so are lost if it
+    exits, and would otherwise be left in progress forever.
+
+    Parameters
+    ----------
+    job : Job
+        The job to check
+
+    Returns
+    -------
+    Job
+        The job
+    """
+    cutoff = datetime.utcnow() - timedelta(seconds=app.config['JOB_TIMEOUT'])
+    if job.in_progress and job.created < cutoff:
+        job.status = 'failed'
+        job.error = 'the job did not finish in time'
+        job.finished = datetime.utcnow()
+        db.session.commit()
+    return job
+
+
+def run(job_id, args):
+    """
+    Run a job, recording its progress in the database.
+    """
+    with app.app_context():
+
+        job = Job.query.get(job_id)
+        job.status = 'running'
+        db.session.commit()
+
+        try:
+            tasks[job.kind](*args)
+        except Exception as e:
+            app.logger.exception('Job %s failed', job_id)
+            db.session.rollback()
+            job = Job.query.get(job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        else:
+            job.status = 'done'
+
+        job.finished = datetime.utcnow()
+        db.session.commit()
@@ -1,9 +1,22 @@
 
 from .app import db
 from datetime import datetime
+from itertools import chain
 import functools
-from sqlalchemy import case, select
+from sqlalchemy import (and_, bindparam, case, event, func, inspect, literal,
+                        null, or_, select)
 from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.orm import aliased
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.sql import text
+
+# Orders that entries can be numbered in, given the entries table to sort
+NUMBERING_ORDERS = {
+    'handler': lambda entry: [entry.handler],
+    'size': lambda entry: [case([(entry.size == 'S', 0),
+                                 (entry.size == 'M', 1)], else_=2),
+                           entry.handler],
+}
 
 class League(db.Model):
 
@@ -40,13 +53,74 @@ class League(db.Model):
             return False
         return self.last_entry < self.numbering_assigned
 
-    def assign_numbering(self):
-        for i, entry in enumerate(self.entries):
-            entry.number = i + 1
+    def assign_numbering(self, order='handler', renumber=True):
+        """
+        Number the entries in the league for their chits in a single UPDATE.
+
+        Parameters
+        ----------
+        order : str, optional
+            The key in NUMBERING_ORDERS giving the order to number entries in
+        renumber : bool, optional
+            Set to False to keep existing numbers, so that printed chits stay
+            valid, and only number new entries after the highest number
+            already assigned
+        """
+
+        # Only entries without a number are numbered when not renumbering
+        criteria = [Entry.league_id == self.id]
+        if renumber:
+            offset = 0
+        else:
+            criteria.append(Entry.number == None)
+            highest = func.coalesce(func.max(Entry.number), 0)
+            offset = db.session.query(highest) \
+                               .filter(Entry.league_id == self.id) \
+                               .scalar()
+
+        # Number the entries in order, breaking ties by entry id so that the
+        # numbering is repeatable
+        ranked = aliased(Entry)
+        numbering = select([ranked.id,
+                            func.row_number()
+                                .over(order_by=NUMBERING_ORDERS[order](ranked)
+                                               + [ranked.id])
+                                .label('number')]) \
+                       .where(ranked.league_id == self.id)
+        if not renumber:
+            numbering = numbering.where(ranked.number == None)
+        numbering = numbering.alias('numbering')
+        number = select([numbering.c.number + offset]) \
+                    .where(numbering.c.id == Entry.id) \
+                    .as_scalar()
+
+        db.session.execute(Entry.__table__.update()
+                                          .where(and_(*criteria))
+                                          .values(number=number))
+
+        # Entries already loaded hold their old numbers
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, Entry) and obj.league_id == self.id:
+                db.session.expire(obj, ['number'])
+
         self.numbering_assigned = datetime.utcnow()
 
+    def update_points(self):
+        """
+        Recompute points for every course in the league in one transaction.
+        """
+        now = datetime.now()
+        courses = [course for round in self.rounds for course in round.courses]
+        for course in courses:
+            course.assign_points(now)
+        refresh_standings(self, courses)
+        db.session.commit()
+
 class Round(db.Model):
     __tablename__ = 'rounds'
+    __table_args__ = (
+        db.Index('ix_rounds_league_date', 'league_id', 'date'),
+    )
     id      = db.Column(db.Integer, primary_key=True)
     date    = db.Column(db.Date, nullable=False)
     league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'))
@@ -80,6 +154,9 @@ class Class(db.Model):
 
 class Entry(db.Model):
     __tablename__ = 'entries'
+    __table_args__ = (
+        db.Index('ix_entries_league_handler', 'league_id', 'handler'),
+    )
     id      = db.Column(db.Integer, primary_key=True)
     handler = db.Column(db.String)
     dog     = db.Column(db.String)
@@ -109,6 +186,10 @@ class Entry(db.Model):
 
 class Course(db.Model):
     __tablename__ = 'courses'
+    __table_args__ = (
+        db.Index('ix_courses_round', 'round_id'),
+        db.Index('ix_courses_class', 'class_id'),
+    )
     id = db.Column(db.Integer, primary_key=True)
 
     round_id = db.Column(db.Integer, db.ForeignKey('rounds.id'))
@@ -125,87 +206,84 @@ class Course(db.Model):
     def name(self):
         return '{} {}'.format(self.clss.name, self.round.name)
 
-    @property
-    def points_up_to_date(self):
-
-        # Check if points have ever been assigned
-        if self.points_assigned is None:
-            return False
-
-        # Query for time of last updated score
-        most_recent = Score.query.filter(Score.course == self) \
-                                 .order_by(Score.modified.desc()) \
-                                 .first()
-        
-        # Case when no courses have been applied
-        if most_recent is None:
-            # No points assignment to be done
-            return True
+    def assign_points(self, now=None):
+        """
+        Assign points to all scores on this course.
 
-        # Points are up to date as long as the last points assignment was later
-        # than or at the same time as the last modification of any score
-        return self.points_assigned >= most_recent.modified
+        The scores are ranked in one query and their points written in one
+        executemany UPDATE. The session is not committed, so several courses
+        can be recomputed in one transaction.
+        """
 
-    def update_points(self):
-        
         # Get the current time once to ensure all assigned times here are
         # the same
-        now = datetime.now()
-
-        # Get total entrants in league
-        n_entrants = Entry.query.filter_by(league=self.round.league) \
-                                .count()
-
-        # Build query to get all scores for this course
-        query = Score.query.filter(Score.course == self)
+        if now is None:
+            now = datetime.now()
+
+        # Total entrants in league
+        n_entrants = db.session.query(func.count(Entry.id)) \
+                               .filter(Entry.league_id == self.round.league_id)\
+                               .scalar()
+
+        # Order the scores as Score.order does, but with the course time
+        # bound once rather than looked up for every score
+        time_over = Score.time - literal(self.time)
+        time_faults = case([(time_over > 0., time_over)], else_=0.)
+        total_faults = Score.faults + time_faults
+        order = case([(total_faults == 0, time_over)], else_=total_faults)
+
+        # Eliminations last, then the best dog first
+        ranking = db.session.query(Score.entry_id, Score.eliminated) \
+                            .filter(Score.course_id == self.id) \
+                            .order_by(Score.eliminated, order, Score.entry_id)
 
-        # Get non-eliminated scores in correct order
-        scores = sorted(query.filter(Score.eliminated == False).all(),
-                        key=lambda s: s.order)
-        
         # Assign points in order, with the best dog getting a number of points
         # equal to the number of participants in the league, and each successive
-        # dog getting one point less
-        for i, s in enumerate(scores):
-            s.points = n_entrants - i
-            s.modified = now
-
-        # Assign one point to eliminations
-        for s in query.filter(Score.eliminated == True).all():
-            s.points = 1
-            s.modified = now
+        # dog getting one point less. Eliminations get one point.
+        rows = []
+        for rank, (entry_id, eliminated) in enumerate(ranking):
+            points = 1 if eliminated else n_entrants - rank
+            rows.append({'c': self.id, 'e': entry_id, 'p': points, 'now': now})
+
+        if rows:
+            table = Score.__table__
+            db.session.execute(table.update()
+                                    .where(table.c.course_id == bindparam('c'))
+                                    .where(table.c.entry_id == bindparam('e'))
+                                    .values(points=bindparam('p'),
+                                            modified=bindparam('now')),
+                               rows)
 
         # Update points counter
         self.points_assigned = now
-        
+
+    def update_points(self):
+        self.assign_points()
+        refresh_standings(self.round.league, [self])
         db.session.commit()
 
     @property
     def scores(self):
 
-        if not self.points_up_to_date:
-            self.update_points()
-
-        # Query for all participating dogs
-        q_participated = Score.query.filter(Score.course == self) \
-                                    .order_by(Score.points.desc())
-
-        # Query getting all entries to the league
-        q_all = db.session.query(Entry).filter_by(league=self.round.league)
-
-        # Subquery getting all entries already scored for this course
-        q_scored = Score.query.filter(Score.course_id == self.id) \
-                              .with_entities(Score.entry_id)
+        # Query all entrants to the league, each with their score on this
+        # course if they participated, ranked by points with no-shows last
+        query = db.session.query(Entry, Score) \
+                          .outerjoin(Score, and_(Score.entry_id == Entry.id,
+                                                 Score.course_id == self.id)) \
+                          .filter(Entry.league_id == self.round.league_id) \
+                          .order_by(Score.entry_id.is_(None),
+                                    Score.points.desc(),
+                                    Score.eliminated,
+                                    Score.order)
 
-        # Query getting all entrants that were not scored on this course
-        q_noshow = q_all.filter(~Entry.id.in_(q_scored))
-      
-        noshows = [ScoreNoShow(entry) for entry in q_noshow.all()]
-        
-        return q_participated.all() + noshows
+        return [ScoreNoShow(entry) if score is None else score
+                for entry, score in query]
 
 class Score(db.Model):
     __tablename__ = 'scores'
+    __table_args__ = (
+        db.Index('ix_scores_course_modified', 'course_id', 'modified'),
+    )
 
     course_id = db.Column(db.Integer, db.ForeignKey('courses.id'),
                           primary_key=True)
@@ -226,24 +304,50 @@ class Score(db.Model):
 
     points = db.Column(db.Integer, default=-1)
     
-    @property
+    @hybrid_property
+    def course_time(self):
+        return self.course.time
+
+    @course_time.expression
+    def course_time(cls):
+        return select([Course.time]).where(Course.id == cls.course_id) \
+                                    .correlate_except(Course) \
+                                    .as_scalar()
+
+    @hybrid_property
     def time_faults(self):
         if self.eliminated:
             return None
-        time_over = self.time - self.course.time
+        time_over = self.time - self.course_time
         return time_over if time_over > 0. else 0.
 
-    @property
+    @time_faults.expression
+    def time_faults(cls):
+        time_over = cls.time - cls.course_time
+        return case([(cls.eliminated == True, None),
+                     (time_over > 0., time_over)],
+                    else_=0.)
+
+    @hybrid_property
     def total_faults(self):
         if self.eliminated:
             return None
         return self.faults + self.time_faults
 
-    @property
+    @total_faults.expression
+    def total_faults(cls):
+        return case([(cls.eliminated == True, None)],
+                    else_=cls.faults + cls.time_faults)
+
+    @hybrid_property
     def clear_round(self):
         return self.total_faults == 0
 
-    @property
+    @clear_round.expression
+    def clear_round(cls):
+        return and_(cls.eliminated == False, cls.total_faults == 0)
+
+    @hybrid_property
     def order(self):
         """
         Score for ordering all participants by faults and time.
@@ -251,10 +355,47 @@ class Score(db.Model):
         if self.eliminated:
             return -1e10
         elif self.clear_round:
-            return self.time - self.course.time
+            return self.time - self.course_time
         else:
             return self.total_faults
 
+    @order.expression
+    def order(cls):
+        return case([(cls.eliminated == True, -1e10),
+                     (cls.clear_round, cls.time - cls.course_time)],
+                    else_=cls.total_faults)
+
+class Job(db.Model):
+    """
+    A report generated in the background, such as a set of chits.
+    """
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Only one job at a time for each output, across all processes
+        db.Index('ix_jobs_key_active', 'key', unique=True,
+                 sqlite_where=text("status IN ('queued', 'running')"),
+                 postgresql_where=text("status IN ('queued', 'running')")),
+    )
+    id   = db.Column(db.Integer, primary_key=True)
+
+    # Identifies the output, so identical jobs can share one run
+    key  = db.Column(db.String, nullable=False, index=True)
+    kind = db.Column(db.String, nullable=False)
+
+    status = db.Column(db.Enum('queued', 'running', 'done', 'failed'),
+                       nullable=False, default='queued')
+
+    # Where to find the output once done
+    url   = db.Column(db.String)
+    error = db.Column(db.String)
+
+    created  = db.Column(db.DateTime, default=datetime.utcnow)
+    finished = db.Column(db.DateTime)
+
+    @property
+    def in_progress(self):
+        return self.status in ('queued', 'running')
+
 class ScoreNoShow(object):
     def __init__(self, entry):
         self.entry = entry
@@ -268,10 +409,220 @@ class ScoreNoShow(object):
         self.created = None
         self.modified = None
 
+class Standing(db.Model):
+    """
+    Materialised points totals, read by the league results pages.
+
+    Rows with both a round and a class hold the points of one course, and
+    rows with only a round the total over all classes in that round. Totals
+    over rounds are left to PointsTable, as they depend on the rounds and
+    number of scoring rounds of the league at the time.
+    """
+    __tablename__ = 'league_standings'
+    __table_args__ = (
+        db.Index('ix_league_standings_round', 'league_id', 'round_id',
+                 'class_id'),
+        db.Index('ix_league_standings_class', 'league_id', 'class_id',
+                 'round_id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+
+    league_id = db.Column(db.Integer, db.ForeignKey('leagues.id'),
+                          nullable=False)
+    entry_id  = db.Column(db.Integer, db.ForeignKey('entries.id'),
+                          nullable=False)
+    round_id  = db.Column(db.Integer, db.ForeignKey('rounds.id'))
+    class_id  = db.Column(db.Integer, db.ForeignKey('classes.id'))
+
+    points = db.Column(db.Integer, nullable=False)
+
+def refresh_standings(league, courses):
+    """
+    Update the materialised standings affected by new points on courses.
+
+    Parameters
+    ----------
+    league : League
+        The league the courses belong to
+    courses : list
+        The Course objects that have had their points assigned
+    """
+    if not courses:
+        return
+
+    table = Standing.__table__
+    columns = ['league_id', 'entry_id', 'round_id', 'class_id', 'points']
+    round_ids = {course.round_id for course in courses}
+    class_ids = {course.class_id for course in courses}
+
+    def replace(select, *criterion):
+        db.session.execute(table.delete()
+                                .where(table.c.league_id == league.id)
+                                .where(and_(*criterion)))
+        db.session.execute(table.insert().from_select(columns, select))
+
+    # Points of each entry on each of the courses
+    replace(select([literal(league.id), Score.entry_id, Course.round_id,
+                    Course.class_id, Score.points])
+               .where(Score.course_id == Course.id)
+               .where(Course.round_id.in_(round_ids))
+               .where(Course.class_id.in_(class_ids)),
+            table.c.round_id.in_(round_ids),
+            table.c.class_id.in_(class_ids))
+
+    # Totals over all classes for the affected rounds
+    replace(select([literal(league.id), table.c.entry_id, table.c.round_id,
+                    null(), func.sum(table.c.points)])
+               .where(table.c.league_id == league.id)
+               .where(table.c.round_id.in_(round_ids))
+               .where(table.c.class_id != None)
+               .group_by(table.c.round_id, table.c.entry_id),
+            table.c.round_id.in_(round_ids),
+            table.c.class_id == None)
+
+@event.listens_for(db.session, 'after_flush')
+def track_stale_points(session, flush_context):
+    """
+    Record the courses and leagues whose points are invalidated by a flush.
+    """
+    courses = session.info.setdefault('stale_courses', set())
+    leagues = session.info.setdefault('stale_leagues', set())
+
+    for obj in chain(session.new, session.dirty, session.deleted):
+
+        # Any change to a score changes the ranking on its course
+        if isinstance(obj, Score):
+            courses.add(obj.course_id)
+
+        # Changing the course time changes time faults for every score
+        elif isinstance(obj, Course):
+            if obj in session.new or \
+                    inspect(obj).attrs.time.history.has_changes():
+                courses.add(obj.id)
+
+        # Points depend on the number of entrants to the league
+        elif isinstance(obj, Entry):
+            if obj in session.new or obj in session.deleted:
+                leagues.add(obj.league_id)
+
+        # Changes to a league, e.g. its numbering, show on its results pages
+        elif isinstance(obj, League):
+            session.info.setdefault('changed_leagues', set()).add(obj.id)
+
+    courses.discard(None)
+    leagues.discard(None)
+
+def mark_points_stale(session, courses=(), leagues=()):
+    """
+    Record courses and leagues whose points need recomputing on commit.
+
+    Changes made through the ORM are tracked automatically, so this is only
+    needed after bulk statements that bypass it.
+
+    Parameters
+    ----------
+    session : Session
+        The session that will be committed
+    courses : iterable, optional
+        The ids of courses with changed scores
+    leagues : iterable, optional
+        The ids of leagues with changed entries
+    """
+    session.info.setdefault('stale_courses', set()).update(courses)
+    session.info.setdefault('stale_leagues', set()).update(leagues)
+
+@event.listens_for(db.session, 'before_commit')
+def recompute_stale_points(session):
+    """
+    Bring points up to date for everything invalidated in this transaction.
+    """
+
+    # Make sure all pending changes have been tracked
+    session.flush()
+
+    course_ids = session.info.pop('stale_courses', set())
+    league_ids = session.info.pop('stale_leagues', set())
+
+    if not course_ids and not league_ids:
+        return
+
+    # Each stale course is recomputed once, however many of its scores changed
+    courses = session.query(Course) \
+                     .join(Course.round) \
+                     .filter(or_(Course.id.in_(course_ids),
+                                 Round.league_id.in_(league_ids)))
+
+    # Recompute the standings of each league once for all of its courses
+    by_league = {}
+    for course in courses:
+        by_league.setdefault(course.round.league, []).append(course)
+
+    now = datetime.now()
+    for league, league_courses in by_league.items():
+        for course in league_courses:
+            course.assign_points(now)
+        refresh_standings(league, league_courses)
+
+    # Let caches of the results know they are out of date once committed
+    session.info.setdefault('changed_leagues', set()) \
+                .update(league.id for league in by_league)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_stale_points(session, previous_transaction):
+    session.info.pop('stale_courses', None)
+    session.info.pop('stale_leagues', None)
+
 def initialise():
     """Create the schema"""
     db.create_all()
 
+def migrate():
+    """
+    Bring the schema of an existing database up to date without losing data.
+
+    Missing tables, columns and indexes are created. Existing columns are
+    left as they are, and new columns must be nullable or have a server
+    default. A new standings table is filled from the existing scores.
+    """
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    existing = set(inspector.get_table_names())
+    created = set()
+
+    with db.engine.begin() as connection:
+
+        for table in db.metadata.sorted_tables:
+
+            # New tables are created along with their indexes
+            if table.name not in existing:
+                table.create(connection)
+                created.add(table.name)
+                print('Created table {}'.format(table.name))
+                continue
+
+            columns = set(c['name'] for c in inspector.get_columns(table.name))
+            for column in table.columns:
+                if column.name not in columns:
+                    ddl = CreateColumn(column).compile(dialect=dialect)
+                    connection.execute(text('ALTER TABLE {} ADD COLUMN {}'
+                                            .format(table.name, ddl)))
+                    print('Added column {}.{}'.format(table.name,
+                                                      column.name))
+
+            indexes = set(i['name'] for i in inspector.get_indexes(table.name))
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    print('Created index {}'.format(index.name))
+
+    # Standings are only kept up to date as scores change, so work them out
+    # for the scores already entered
+    if Standing.__tablename__ in created:
+        for league in League.query.all():
+            league.update_points()
+            print('Computed standings for {}'.format(league.name))
+
 def populate():
     """
     Temporary for development: Populate some data
@@ -343,6 +694,13 @@ if __name__ == '__main__':
     if '--populate' in sys.argv:
         initialise()
         populate()
+    elif '--migrate' in sys.argv:
+        migrate()
+    elif '--recompute' in sys.argv:
+        for league in League.query.all():
+            league.update_points()
     else:
-        print('add --populate to add data')
+        print('add --populate to add data, --migrate to update the schema of '
+              'an existing database, or --recompute to recompute all points '
+              'and standings')
         sys.exit(1)
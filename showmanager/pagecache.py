@@ -0,0 +1,162 @@
+from collections import OrderedDict
+from concurrent.futures import Future, TimeoutError
+import threading
+
+from sqlalchemy import event
+
+from .app import app, db
+from .cache import FileCache, cache_key
+
+
+class PageCache(object):
+    """
+    An in-process LRU cache of rendered pages and the tables behind them.
+
+    Keys start with the id of the league the value belongs to and end with
+    the version of the data it was built from, so a value is never served
+    once its data has changed. Invalidating a league just frees the memory
+    of its old values early.
+
+    Concurrent requests for a missing key wait for a single build rather
+    than each building the value, unless it takes longer than the wait.
+
+    Parameters
+    ----------
+    max_entries : int, optional
+        The most values to hold in memory
+    directory : str, optional
+        A directory to also store rendered pages in, so that processes on
+        the same machine can share them
+    max_size : int, optional
+        The maximum total size of the pages stored on disk, in bytes
+    wait : float, optional
+        How long to wait for another request's build before building the
+        value again, in seconds
+    """
+
+    def __init__(self, max_entries=256, directory=None,
+                 max_size=100 * 1024 * 1024, wait=10):
+        self.max_entries = max_entries
+        self.wait = wait
+        self.entries = OrderedDict()
+        self.building = {}
+        self.lock = threading.Lock()
+        self.disk = FileCache(directory, max_size) if directory else None
+
+    def get(self, key, build):
+        """
+        Get a value from the cache, building it if missing.
+
+        Parameters
+        ----------
+        key : tuple
+            The league id, then whatever identifies the value, then the
+            version of its data
+        build : callable
+            Builds the value when it is not cached
+
+        Returns
+        -------
+        object
+            The value
+        """
+        with self.lock:
+            try:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            except KeyError:
+                pass
+
+            # Wait for a build already under way
+            future = self.building.get(key)
+            if future is None:
+                future = self.building[key] = Future()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            try:
+                return future.result(timeout=self.wait)
+            except TimeoutError:
+                # Don't hold this request up any longer for a slow build
+                return build()
+
+        try:
+            value = build()
+        except BaseException as e:
+            with self.lock:
+                del self.building[key]
+            future.set_exception(e)
+            raise
+
+        with self.lock:
+            del self.building[key]
+            self.entries[key] = value
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        future.set_result(value)
+
+        return value
+
+    def get_page(self, key, render):
+        """
+        Get a rendered page, also checking the disk store if there is one.
+
+        The page is rendered in full before it is sent, so requests waiting
+        for it are not held up by how fast the first client reads it.
+
+        Parameters
+        ----------
+        key : tuple
+            The key of the page, as for get
+        render : callable
+            Renders the page as bytes when it is not cached
+
+        Returns
+        -------
+        bytes
+            The page
+        """
+        if self.disk is None:
+            return self.get(key, render)
+
+        def build():
+            path_key = cache_key(*key)
+            path = self.disk.get(path_key)
+            if path is None:
+                body = render()
+                self.disk.put(path_key, lambda fp: fp.write(body))
+                return body
+            with open(path, 'rb') as fp:
+                return fp.read()
+
+        return self.get(key, build)
+
+    def invalidate(self, league_id):
+        """
+        Drop the cached values of a league.
+        """
+        with self.lock:
+            for key in [k for k in self.entries if k[0] == league_id]:
+                del self.entries[key]
+
+
+page_cache = PageCache(app.config['PAGE_CACHE_ENTRIES'],
+                       app.config['PAGE_CACHE_DIR'],
+                       app.config['PAGE_CACHE_SIZE'],
+                       app.config['PAGE_CACHE_WAIT'])
+
+
+@event.listens_for(db.session, 'after_commit')
+def invalidate_changed_leagues(session):
+    """
+    Drop the cached pages of leagues whose results changed on commit.
+    """
+    for league_id in session.info.pop('changed_leagues', ()):
+        page_cache.invalidate(league_id)
+
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def discard_changed_leagues(session, previous_transaction):
+    session.info.pop('changed_leagues', None)
@@ -0,0 +1,118 @@
+from concurrent.futures import Future
+from datetime import datetime
+import queue
+import threading
+import time
+
+from .app import app, db
+from .models import League, Entry, mark_points_stale
+
+
+class RegistrationWriter(object):
+    """
+    Write registrations to the database in batches from a background thread.
+
+    Registrations arriving together are committed in one transaction, with a
+    single update of the last entry time of each league, rather than
+    queueing every registrant for the database one at a time.
+
+    Parameters
+    ----------
+    batch_size : int, optional
+        The most registrations to write in one transaction
+    batch_wait : float, optional
+        How long to wait for more registrations before writing a batch, in
+        seconds
+    """
+
+    def __init__(self, batch_size=50, batch_wait=0.05):
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, league_id, values):
+        """
+        Queue a registration to be written.
+
+        Parameters
+        ----------
+        league_id : int
+            The id of the league being entered
+        values : dict
+            The column values of the entry
+
+        Returns
+        -------
+        Future
+            Completes once the registration has been committed
+        """
+        future = Future()
+        self.queue.put((league_id, values, future))
+        self.start()
+        return future
+
+    def start(self):
+        """
+        Start the writer thread, if not already running.
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run,
+                                               name='registration-writer',
+                                               daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """
+        Write batches of registrations as they arrive.
+        """
+        while True:
+            batch = [self.queue.get()]
+
+            # Collect whatever else arrives in a short window
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            self.write(batch)
+
+    def write(self, batch):
+        """
+        Commit a batch of registrations, completing their futures.
+        """
+        with app.app_context():
+            try:
+                league_ids = set(league_id for league_id, _, _ in batch)
+                rows = [dict(values, league_id=league_id)
+                        for league_id, values, _ in batch]
+
+                db.session.execute(Entry.__table__.insert(), rows)
+                db.session.execute(League.__table__.update()
+                                         .where(League.id.in_(league_ids))
+                                         .values(last_entry=datetime.utcnow()))
+
+                # Entries change the points available on every course
+                mark_points_stale(db.session, leagues=league_ids)
+
+                db.session.commit()
+            except Exception as e:
+                app.logger.exception('Failed to write %d registrations',
+                                     len(batch))
+                db.session.rollback()
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                for _, _, future in batch:
+                    future.set_result(None)
+
+
+writer = RegistrationWriter(app.config['REGISTRATION_BATCH_SIZE'],
+                            app.config['REGISTRATION_BATCH_WAIT'])
@@ -0,0 +1,158 @@
+from datetime import timezone
+
+from sqlalchemy import distinct, func
+
+from .app import db
+from .cache import cache_key
+from .models import Class, Course, Round, Score, Standing
+from .util import PointsTable
+
+
+def points_query(league, key, *criterion):
+    """
+    Query the materialised points of each entry in a league.
+
+    Parameters
+    ----------
+    league : League
+        The league to get points for
+    key : column
+        The standings column identifying the table column, e.g.
+        Standing.round_id
+    criterion
+        Filters selecting the standings rows to include
+
+    Returns
+    -------
+    Query
+        A query yielding (key, entry id, points) rows
+    """
+    return db.session.query(key, Standing.entry_id, Standing.points) \
+                     .filter(Standing.league_id == league.id) \
+                     .filter(key != None) \
+                     .filter(*criterion)
+
+
+def accumulate(table, entries, columns, query):
+    """
+    Add the rows of a points query to a PointsTable.
+
+    Parameters
+    ----------
+    table : PointsTable
+        The table to add points to
+    entries : list
+        The Entry objects in the table
+    columns : dict
+        Mapping of the query key to the table column
+    query : Query
+        A query yielding (key, entry id, points) rows
+    """
+    entries = {entry.id: entry for entry in entries}
+
+    # Skip points left over from rounds or classes since removed
+    rows = [row for row in query if row[0] in columns]
+
+    table.accumulate_many([entries[entry_id] for _, entry_id, _ in rows],
+                          [columns[key] for key, _, _ in rows],
+                          [points for _, _, points in rows])
+    return table
+
+
+def league_table(league, table_class=PointsTable):
+    """
+    Build the overall standings of a league, with a column per round.
+    """
+    columns = {round.id: round.shortname for round in league.rounds}
+    table = table_class(league.entries,
+                        [round.shortname for round in league.rounds],
+                        league.scoring_rounds)
+    query = points_query(league, Standing.round_id,
+                         Standing.class_id == None)
+    return accumulate(table, league.entries, columns, query)
+
+
+def round_table(round, table_class=PointsTable):
+    """
+    Build the standings of a single round, with a column per class.
+    """
+    league = round.league
+    columns = {clss.id: clss.name for clss in league.classes}
+    table = table_class(league.entries,
+                        [clss.name for clss in league.classes])
+    query = points_query(league, Standing.class_id,
+                         Standing.round_id == round.id)
+    return accumulate(table, league.entries, columns, query)
+
+
+def class_table(clss, table_class=PointsTable):
+    """
+    Build the standings of a single class, with a column per round.
+    """
+    league = clss.league
+    columns = {round.id: round.shortname for round in league.rounds}
+    table = table_class(league.entries,
+                        [round.shortname for round in league.rounds],
+                        league.scoring_rounds)
+    query = points_query(league, Standing.round_id,
+                         Standing.class_id == clss.id)
+    return accumulate(table, league.entries, columns, query)
+
+
+def results_version(league, *criterion):
+    """
+    Get validators for a results page from the change times of its data.
+
+    Only the latest change times are looked up, along with the rounds and
+    classes of the league that name the columns of the tables, so this is
+    much cheaper than building the page.
+
+    Parameters
+    ----------
+    league : League
+        The league the page is for
+    criterion
+        Filters on Course selecting the courses shown on the page
+
+    Returns
+    -------
+    tuple
+        An ETag, and the time of the latest change as a naive UTC datetime
+    """
+    points_assigned, modified, courses = \
+        db.session.query(func.max(Course.points_assigned),
+                         func.max(Score.modified),
+                         func.count(distinct(Course.id))) \
+                  .select_from(Course) \
+                  .join(Round, Course.round_id == Round.id) \
+                  .outerjoin(Score, Score.course_id == Course.id) \
+                  .filter(Round.league_id == league.id) \
+                  .filter(*criterion) \
+                  .one()
+
+    # Rounds are numbered by date and headed by class name, and adding or
+    # removing one changes the totals without touching any scores
+    rounds = db.session.query(Round.id, Round.date) \
+                       .filter(Round.league_id == league.id) \
+                       .order_by(Round.id) \
+                       .all()
+    classes = db.session.query(Class.id, Class.name) \
+                        .filter(Class.league_id == league.id) \
+                        .order_by(Class.id) \
+                        .all()
+
+    etag = cache_key(league.id, league.name, league.scoring_rounds,
+                     league.last_entry, league.numbering_assigned,
+                     points_assigned, modified, courses,
+                     [tuple(row) for row in rounds],
+                     [tuple(row) for row in classes])
+
+    # Points are stamped in local time and entries in UTC, so convert the
+    # points times to naive UTC to compare them
+    times = [t.astimezone(timezone.utc).replace(tzinfo=None)
+             for t in (points_assigned, modified) if t is not None]
+    times += [t for t in (league.last_entry, league.numbering_assigned)
+              if t is not None]
+    last_modified = max(times) if times else None
+
+    return etag, last_modified
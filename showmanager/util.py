@@ -1,92 +1,132 @@
 
+from array import array
 import functools
 
+# numpy is optional, and slow to import, so is only imported when needed
+np = None
+
+def import_numpy():
+    """
+    Import numpy on first use.
+
+    Returns
+    -------
+    module or None
+        numpy, or None if it is not installed
+    """
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            return None
+    return np
+
 @functools.total_ordering
 class CompoundScore(object):
+
+    __slots__ = ('points', 'num_best_rounds', '_sort_key')
+
     def __init__(self, num_rounds, num_best_rounds=None):
-        self.points = [0 for i in range(num_rounds)]
+        self.points = array('l', [0]) * num_rounds
         self.num_best_rounds = num_best_rounds
+        self._sort_key = None
 
     def __getitem__(self, index):
         return self.points[index]
 
     def __setitem__(self, index, value):
         self.points[index] = value
+        self._sort_key = None
+
+    def __iter__(self):
+        return iter(self.points)
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def sort_key(self):
+        """
+        Tuple to rank scores by: the total, or the best rounds and tie breaker.
+        """
+        if self._sort_key is None:
+            if self.num_best_rounds is None:
+                self._sort_key = (sum(self.points),)
+            else:
+                ranked = sorted(self.points, reverse=True)
+                self._sort_key = (sum(ranked[:self.num_best_rounds]),
+                                  sum(ranked[self.num_best_rounds:]))
+        return self._sort_key
 
     @property
     def total(self):
-        return sum(self.points)
+        return sum(self.sort_key)
 
     @property
     def best_rounds(self):
         if self.num_best_rounds is None:
             raise ValueError('number of best rounds to take not set')
-        return sum(sorted(self.points, reverse=True)[:self.num_best_rounds])
+        return self.sort_key[0]
 
     @property
     def tie_breaker(self):
         if self.num_best_rounds is None:
             raise ValueError('number of best rounds to take not set')
-        return sum(sorted(self.points, reverse=True)[self.num_best_rounds:])
+        return self.sort_key[1]
 
     def __lt__(self, other):
         if other is None:
             return False
-        if self.num_best_rounds is None:
-            return self.total < other.total
-        else:
-            if self.best_rounds < other.best_rounds:
-                return True
-            elif self.best_rounds == other.best_rounds:
-                return self.tie_breaker < other.tie_breaker
-            else:
-                return False
+        return self.sort_key < other.sort_key
 
     def __eq__(self, other):
         if other is None:
             return False
-        if self.num_best_rounds is None:
-            return self.total == other.total
-        else:
-            if self.best_rounds == other.best_rounds:
-                return self.tie_breaker == other.tie_breaker
-            else:
-                return False
+        return self.sort_key == other.sort_key
 
 class HTMLTable(object):
     def __init__(self, headers, data):
         self.headers = headers
         self.data = data
-    def __html__(self):
-        html = '<table class="table table-hover table-bordered">\n'
-        html += '<thead>'
-        html += '<tr>'
-        for cell in self.headers:
-            html += '<th>{}</th>'.format(cell)
-        html += '</tr>'
-        html += '</thead>\n'
-        html += '<tbody>\n'
+
+    def iter_html(self):
+        """
+        Generate the HTML of the table in chunks, one row at a time.
+        """
+        yield '<table class="table table-hover table-bordered">\n'
+        yield '<thead><tr>{}</tr></thead>\n'.format(
+            ''.join('<th>{}</th>'.format(cell) for cell in self.headers))
+        yield '<tbody>\n'
         for row in self.data:
-            html += '<tr>'
-            for cell in row:
-                html += '<td>{}</td>'.format(cell)
-            html += '</tr>\n'
-        html += '</tbody>\n'
-        html += '</table>'
-        return html
+            yield '<tr>{}</tr>\n'.format(
+                ''.join('<td>{}</td>'.format(cell) for cell in row))
+        yield '</tbody>\n'
+        yield '</table>'
+
+    def __html__(self):
+        return ''.join(self.iter_html())
 
 class PointsTable(object):
 
     def __init__(self, entries, columns, scoring_rounds=None):
         self.columns = columns
+        self.column_index = {c: i for i, c in enumerate(columns)}
         self.data = {e: CompoundScore(len(columns), scoring_rounds)
                      for e in entries}
         self.scoring_rounds = scoring_rounds
     
     def accumulate(self, entry, column, points):
-        index = self.columns.index(column)
+        index = self.column_index[column]
         self.data[entry][index] += points
 
+    def accumulate_many(self, entries, columns, points):
+        """
+        Accumulate points from parallel sequences of entries and columns.
+        """
+        for entry, column, p in zip(entries, columns, points):
+            self.accumulate(entry, column, p)
+
     def header(self):
         header = ['Rank', 'Dog No.', 'Handler', 'Dog', 'HRAJ1']
         header += self.columns 
@@ -99,7 +139,8 @@ class PointsTable(object):
     def rows(self):
 
         # Sort by total points, in descending order
-        sorted_data = sorted(self.data.items(), key=lambda p: p[1], reverse=True)
+        sorted_data = sorted(self.data.items(), key=lambda p: p[1].sort_key,
+                             reverse=True)
 
         last_rank = None
         last_points = None
@@ -128,6 +169,94 @@ class PointsTable(object):
 
             yield row
 
+    def iter_html(self):
+        return HTMLTable(self.header(), self.rows()).iter_html()
+
     def __html__(self):
-        table = HTMLTable(self.header(), self.rows())
-        return table.__html__()
+        return ''.join(self.iter_html())
+
+
+class ArrayPointsTable(PointsTable):
+    """
+    A PointsTable holding points in a NumPy array, one row per entry.
+
+    Accumulation and ranking are vectorised, for ranking large numbers of
+    entries at once. Requires numpy.
+    """
+
+    def __init__(self, entries, columns, scoring_rounds=None):
+        if import_numpy() is None:
+            raise ImportError('numpy is required for ArrayPointsTable')
+        self.columns = columns
+        self.column_index = {c: i for i, c in enumerate(columns)}
+        self.entries = list(entries)
+        self.entry_index = {e: i for i, e in enumerate(self.entries)}
+        self.points = np.zeros((len(self.entries), len(columns)),
+                               dtype=np.int64)
+        self.scoring_rounds = scoring_rounds
+
+    def accumulate(self, entry, column, points):
+        index = self.entry_index[entry], self.column_index[column]
+        self.points[index] += points
+
+    def accumulate_many(self, entries, columns, points):
+        """
+        Accumulate points from parallel sequences of entries and columns.
+        """
+        rows = np.array([self.entry_index[e] for e in entries], dtype=np.intp)
+        cols = np.array([self.column_index[c] for c in columns], dtype=np.intp)
+        np.add.at(self.points, (rows, cols), points)
+
+    def sort_keys(self):
+        """
+        Get the keys to rank entries by, one row per entry.
+
+        Returns
+        -------
+        numpy.ndarray
+            The total points, or the best rounds and tie breaker, of each entry
+        """
+        if self.scoring_rounds is None:
+            return self.points.sum(axis=1, keepdims=True)
+        ranked = -np.sort(-self.points, axis=1)
+        return np.column_stack([ranked[:, :self.scoring_rounds].sum(axis=1),
+                                ranked[:, self.scoring_rounds:].sum(axis=1)])
+
+    def ranking(self):
+        """
+        Rank the entries, giving equal rank for equal points.
+
+        Returns
+        -------
+        order : numpy.ndarray
+            The entry indices, best first
+        ranks : numpy.ndarray
+            The rank of each entry in order
+        keys : numpy.ndarray
+            The sort keys of each entry in order
+        """
+        keys = self.sort_keys()
+
+        # Sort descending on the first key, then on subsequent keys; lexsort
+        # is stable so tied entries keep their original order
+        order = np.lexsort([-k for k in keys.T[::-1]])
+        keys = keys[order]
+
+        # Entries take the position of the first entry with equal points
+        new = np.ones(len(order), dtype=bool)
+        new[1:] = np.any(keys[1:] != keys[:-1], axis=1)
+        positions = np.where(new, np.arange(1, len(order) + 1), 0)
+        ranks = np.maximum.accumulate(positions)
+
+        return order, ranks, keys
+
+    def rows(self):
+        order, ranks, keys = self.ranking()
+        for index, rank, key in zip(order.tolist(), ranks.tolist(),
+                                    keys.tolist()):
+            entry = self.entries[index]
+            row = [rank, '-' if entry.number is None else entry.number,
+                   entry.handler, entry.dog, entry.hraj1]
+            row += self.points[index].tolist()
+            row += key
+            yield row
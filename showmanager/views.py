@@ -1,13 +1,111 @@
 from flask import (render_template, make_response, request, abort, redirect,
-                   url_for, flash)
+                   url_for, flash, jsonify, session, Response)
 from sqlalchemy.orm.exc import NoResultFound
-from datetime import datetime, timedelta
+from werkzeug.http import is_resource_modified
+from werkzeug.wsgi import wrap_file
+import codecs
+import concurrent.futures
+from datetime import timedelta
+import os
 
 from .app import app, db
-from .models import League, Round, Class, Course, Entry
-from .util import HTMLTable, PointsTable
-from . import forms
-from .chit import chits as chitgen
+from .models import League, Round, Class, Course, Job, NUMBERING_ORDERS
+from .util import HTMLTable
+from . import forms, ingest, jobs, registration, standings
+from .cache import FileCache, cache_key
+from .pagecache import page_cache
+
+
+chit_cache = FileCache(app.config['CHIT_CACHE_DIR'],
+                       app.config['CHIT_CACHE_SIZE'])
+
+
+def conditional(version, render):
+    """
+    Respond to a request for a page that changes only when its data does.
+
+    Parameters
+    ----------
+    version : tuple
+        The ETag and last modified time of the page's data, as from
+        standings.results_version
+    render : callable
+        Builds the response when the client's copy is out of date
+
+    Returns
+    -------
+    Response
+        The page, or a 304 response without rendering if the client's copy
+        is current
+    """
+    etag, last_modified = version
+
+    # Pending messages are only shown by rendering the page
+    if '_flashes' not in session and \
+            not is_resource_modified(request.environ, etag,
+                                     last_modified=last_modified):
+        response = make_response('', 304)
+    else:
+        response = render()
+
+    # Clients should check for changes every time
+    response.set_etag(etag)
+    response.last_modified = last_modified
+    response.cache_control.no_cache = True
+
+    return response
+
+
+def results_page(key, version, template_name, context):
+    """
+    Respond with a results page, rendering it through the page cache.
+
+    Parameters
+    ----------
+    key : tuple
+        The league id, then the name and id of the page
+    version : tuple
+        The ETag and last modified time of the page's data, as from
+        standings.results_version
+    template_name : str
+        The template of the page
+    context : callable
+        Builds the template context when the page is not cached
+
+    Returns
+    -------
+    Response
+        The page, or a 304 response if the client's copy is current
+    """
+    def render():
+        # Messages waiting are particular to one visitor, and must be taken
+        # from the session before it is saved, so the page is not streamed
+        if '_flashes' in session:
+            return make_response(render_template(template_name, **context()))
+
+        # Render in full, so that requests waiting for the page do not
+        # depend on how fast this client reads it
+        def build():
+            return render_template(template_name, **context()).encode('utf-8')
+
+        return Response(page_cache.get_page(key + (version[0],), build))
+
+    return conditional(version, render)
+
+
+def cached_table(key, version, build):
+    """
+    Get the rows of a PointsTable through the page cache, keyed as for
+    results_page.
+
+    Only the header and rows are kept, not the Entry objects behind them, so
+    the cached table can be shared between requests.
+    """
+    def rows():
+        table = build()
+        return HTMLTable(table.header(), list(table.rows()))
+
+    return page_cache.get(key + (version[0],), rows)
 
 
 @app.route('/')
@@ -28,7 +126,12 @@ def league(id):
 @app.route('/league/<int:id>/number', methods=['POST'])
 def league_number(id):
     league = League.query.filter_by(id=id).first_or_404()
-    league.assign_numbering()
+
+    # Keep existing numbers unless asked to renumber every entry
+    order = request.form.get('order', 'handler')
+    if order not in NUMBERING_ORDERS:
+        abort(400)
+    league.assign_numbering(order, renumber='renumber' in request.form)
     db.session.commit()
     flash('Numbering assigned', 'success')
 
@@ -38,6 +141,19 @@ def league_number(id):
         return redirect(url_for('league', id=league.id))
 
 
+@app.route('/league/<int:id>/points', methods=['POST'])
+def league_points(id):
+    league = League.query.filter_by(id=id).first_or_404()
+    job = jobs.submit('points', 'points-{}'.format(league.id),
+                      url_for('league_overall', id=league.id), league.id)
+    return redirect(url_for('job', id=job.id))
+
+
+@jobs.task('points')
+def recompute_points(league_id):
+    League.query.get(league_id).update_points()
+
+
 @app.route('/league/<int:id>/edit', methods=['GET', 'POST'])
 def league_edit(id):
     league = League.query.filter_by(id=id).first_or_404()
@@ -109,20 +225,21 @@ def register(id):
     # Handle submitted data
     if request.method == 'POST' and form.validate():
 
-        # Create new registrant
-        entry = Entry(handler=form.handler.data,
-                      dog=form.dog.data,
-                      size=form.size.data,
-                      grade=form.grade.data,
-                      rescue=form.rescue.data,
-                      collie=(not form.abc.data),
-                      junior=form.junior.data)
-
-        # Add registration to database session and update show
-        db.session.add(entry)
-        league.last_entry = datetime.utcnow()
-
-        db.session.commit()
+        # Queue the new registrant to be written with others arriving at the
+        # same time, and wait until it has been committed
+        future = registration.writer.submit(league.id, form.entry_values())
+        try:
+            future.result(timeout=app.config['REGISTRATION_TIMEOUT'])
+        except concurrent.futures.TimeoutError:
+            # Still queued, so will most likely be saved shortly
+            flash('Your registration is taking longer than usual to save. '
+                  'Please check the list of entries in a few minutes rather '
+                  'than registering again', 'warning')
+            return redirect(url_for('league', id=league.id))
+        except Exception:
+            flash('Sorry, your registration could not be saved, please try '
+                  'again', 'danger')
+            return render_template('register.html', form=form, league=league)
 
         flash('Thanks for registering', 'info')
         return redirect(url_for('league', id=league.id))
@@ -130,35 +247,70 @@ def register(id):
     return render_template('register.html', form=form, league=league)
 
 
+@app.route('/league/<int:id>/import', methods=['POST'])
+def league_import(id):
+    league = League.query.filter_by(id=id).first_or_404()
+
+    upload = request.files.get('entries')
+    if upload is None or not upload.filename:
+        flash('Choose a file of entries to import', 'danger')
+        return redirect(url_for('league', id=league.id))
+
+    # Read the upload as it is validated, rather than all at once
+    try:
+        format = ingest.entries_format(upload.filename)
+        # TextIOWrapper needs a readable() method, which the temporary files
+        # holding large uploads lack before Python 3.11
+        fp = codecs.getreader('utf-8-sig')(upload.stream)
+        count = ingest.import_entries(league, ingest.read_records(fp, format))
+    except ingest.IngestError as e:
+        db.session.rollback()
+        for error in e.errors[:10]:
+            flash('Record {}: {}'.format(error['index'] + 1, error['error']),
+                  'danger')
+        if len(e.errors) > 10:
+            flash('...and {} more problems'.format(len(e.errors) - 10),
+                  'danger')
+        return redirect(url_for('league', id=league.id))
+    except ValueError as e:
+        db.session.rollback()
+        flash(str(e), 'danger')
+        return redirect(url_for('league', id=league.id))
+
+    db.session.commit()
+
+    flash('Imported {} entries'.format(count), 'success')
+    return redirect(url_for('league', id=league.id))
+
+
 @app.route('/league/<int:id>/overall')
 def league_overall(id):
     league = League.query.filter_by(id=id).first_or_404()
+    version = standings.results_version(league)
 
-    table = PointsTable(league.entries,
-                        [round.shortname for round in league.rounds],
-                        league.scoring_rounds)
-
-    for round in league.rounds:
-        for course in round.courses:
-            for score in course.scores:
-                table.accumulate(score.entry, round.shortname, score.points)
+    def context():
+        table = cached_table((league.id, 'league_table', league.id), version,
+                             lambda: standings.league_table(league))
+        return dict(league=league, table=table)
 
-    return render_template('league_overall.html', league=league, table=table)
+    return results_page((league.id, 'league_overall', league.id), version,
+                        'league_overall.html', context)
 
 
 @app.route('/round/<int:id>')
 def round(id):
     round = Round.query.filter_by(id=id).first_or_404()
-    league = round.league
-
-    table = PointsTable(league.entries,
-                        [clss.name for clss in league.classes])
+    league_id = round.league_id
+    version = standings.results_version(round.league,
+                                        Course.round_id == round.id)
 
-    for course in round.courses:
-        for score in course.scores:
-            table.accumulate(score.entry, course.clss.name, score.points)
+    def context():
+        table = cached_table((league_id, 'round_table', round.id), version,
+                             lambda: standings.round_table(round))
+        return dict(round=round, table=table)
 
-    return render_template('round.html', round=round, table=table)
+    return results_page((league_id, 'round', round.id), version,
+                        'round.html', context)
 
 
 @app.route('/round/<int:id>/chits')
@@ -176,33 +328,121 @@ def round_chits(id):
         flash('Assign chit numbering first', 'danger')
         return redirect(url_for('round', id=round.id))
 
+    from .chit.imposition import LAYOUTS
+
+    # Sheet layout, with 'tiled' kept as shorthand for A4
+    layout = request.args.get('layout',
+                              'a4' if 'tiled' in request.args else 'a6')
+    if layout not in LAYOUTS:
+        abort(404)
+    cut_marks = 'cutmarks' in request.args
+    archive = 'zip' in request.args
+
+    key = chits_key(round, layout, cut_marks, archive)
+
+    if archive:
+        mimetype, filename = 'application/zip', 'chits.zip'
+    else:
+        mimetype, filename = 'application/pdf', 'chits.pdf'
+
+    # Nothing to send if the client already has these chits
+    if request.if_none_match.contains(key):
+        response = make_response('', 304)
+        response.set_etag(key)
+        return response
+
+    path = chit_cache.get(key)
+
+    if path is None:
+
+        # Generate in a background job, and come back here when done
+        if 'background' in request.args:
+            args = request.args.to_dict()
+            del args['background']
+            url = url_for('round_chits', id=round.id, **args)
+            job = jobs.submit('chits', key, url, round.id, layout, cut_marks,
+                              archive)
+            return redirect(url_for('job', id=job.id))
+
+        path = generate_chits(round, layout, cut_marks, archive)
+
+    # Stream the file from disk
+    fp = open(path, 'rb')
+    response = Response(wrap_file(request.environ, fp), mimetype=mimetype,
+                        direct_passthrough=True)
+    response.content_length = os.fstat(fp.fileno()).st_size
+    response.headers['Content-Disposition'] = 'filename="{}"'.format(filename)
+    response.set_etag(key)
+
+    return response
+
+
+def chits_key(round, layout, cut_marks, archive):
+    """
+    Get the cache key of the chits for a round.
+    """
+    league = round.league
     class_names = ['{} Round {}'.format(c.name, round.id)
                    for c in league.classes]
 
-    data = chitgen(class_names, league.entries, 'tiled' in request.args)
+    # The chits only change when the entries or their numbering change
+    return cache_key(league.id, round.id, class_names,
+                     league.numbering_assigned, league.last_entry,
+                     layout, cut_marks, archive)
 
-    response = make_response(data)
-    response.mimetype = 'application/pdf'
-    response.headers['Content-Disposition'] = 'filename="chits.pdf"'
 
-    return response
+def generate_chits(round, layout, cut_marks, archive):
+    """
+    Generate the chits for a round into the chit cache.
+
+    Returns
+    -------
+    str
+        The path to the generated file
+    """
+    # Chits are only drawn by some requests, so only import them here
+    from .chit import write_chits, write_chits_zip
+
+    league = round.league
+    class_names = ['{} Round {}'.format(c.name, round.id)
+                   for c in league.classes]
+
+    # Write newly generated chits straight to the cache, rather than holding
+    # them in memory
+    if archive:
+        # Generate one PDF per class in parallel, for printing at separate
+        # rings
+        def write(fp):
+            write_chits_zip(fp, class_names, league.entries, layout=layout,
+                            cut_marks=cut_marks)
+    else:
+        def write(fp):
+            write_chits(fp, class_names, league.entries, layout=layout,
+                        cut_marks=cut_marks)
+
+    return chit_cache.put(chits_key(round, layout, cut_marks, archive), write)
+
+
+@jobs.task('chits')
+def render_chits(round_id, layout, cut_marks, archive):
+    generate_chits(Round.query.get(round_id), layout, cut_marks, archive)
 
 
 @app.route('/class/<int:id>')
 def clss(id):
 
     clss = Class.query.filter_by(id=id).first_or_404()
-    league = clss.league
-
-    table = PointsTable(league.entries,
-                        [round.shortname for round in league.rounds],
-                        league.scoring_rounds)
+    league_id = clss.league_id
+    version = standings.results_version(clss.league,
+                                        Course.class_id == clss.id)
 
-    for course in clss.courses:
-        for score in course.scores:
-            table.accumulate(score.entry, course.round.shortname, score.points)
+    def context():
+        table = cached_table((league_id, 'class_table', clss.id), version,
+                             lambda: standings.class_table(clss))
+        return dict(clss=clss, table=table)
 
-    return render_template('class.html', clss=clss, table=table)
+    return results_page((league_id, 'class', clss.id), version,
+                        'class.html', context)
 
 
 @app.route('/course/<int:id>')
@@ -215,21 +455,59 @@ def course(id):
 
     def ff(v): return '{:.3f}'.format(v)
 
-    data = []
-    for i, score in enumerate(course.scores):
-        entry = score.entry
-        row = [i+1, entry.number,  entry.handler, entry.dog, entry.hraj1]
+    def rows():
+        for i, score in enumerate(course.scores):
+            entry = score.entry
+            row = [i+1, entry.number,  entry.handler, entry.dog, entry.hraj1]
+
+            if score.eliminated:
+                row += ['E'] * 4
+            elif score.noshow:
+                row += ['NS'] * 4
+            else:
+                row += [ff(score.time), ff(score.time_faults), score.faults,
+                        ff(score.total_faults)]
+            row.append(score.points)
+            yield row
+
+    def context():
+        return dict(course=course, table=HTMLTable(headers, rows()))
+
+    league = course.round.league
+    version = standings.results_version(league, Course.id == course.id)
+    return results_page((league.id, 'course', course.id), version,
+                        'course.html', context)
+
+
+@app.route('/course/<int:id>/scores', methods=['POST'])
+def course_scores(id):
+    """
+    Record a batch of scores for a course, posted as a JSON list.
+    """
+
+    course = Course.query.filter_by(id=id).first_or_404()
+
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return jsonify(errors=[{'error': 'Expected a list of scores'}]), 400
+
+    try:
+        rows = ingest.validate_scores(course, records)
+    except ingest.IngestError as e:
+        return jsonify(errors=e.errors), 400
+
+    # Points are recomputed once for the whole batch on commit
+    ingest.upsert_scores(course, rows)
+    db.session.commit()
+
+    return jsonify(course=course.id, scores=len(rows))
+
 
-        if score.eliminated:
-            row += ['E'] * 4
-        elif score.noshow:
-            row += ['NS'] * 4
-        else:
-            row += [ff(score.time), ff(score.time_faults), score.faults,
-                    ff(score.total_faults)]
-        row.append(score.points)
-        data.append(row)
+@app.route('/job/<int:id>')
+def job(id):
+    job = jobs.expire(Job.query.filter_by(id=id).first_or_404())
 
-    table = HTMLTable(headers, data)
+    if job.status == 'done':
+        return redirect(job.url)
 
-    return render_template('course.html', course=course, table=table)
+    return render_template('job.html', job=job)
@@ -0,0 +1,71 @@
+from datetime import date
+import time
+
+from flask import url_for
+
+from .app import db
+from .models import League
+
+
+def current_round(league, today=None):
+    """
+    Get the latest round of a league that has started, or else the first.
+    """
+    if today is None:
+        today = date.today()
+    started = [round for round in league.rounds if round.date <= today]
+    if started:
+        return started[-1]
+    if league.rounds:
+        return league.rounds[0]
+    return None
+
+
+def warm_up(app):
+    """
+    Prime caches before serving, so the first requests are not slow.
+
+    Every template is compiled, and the leagues list and the overall and
+    current round standings of each league are rendered once. Database
+    connections opened along the way are closed again, so none are shared
+    with worker processes forked afterwards.
+
+    Parameters
+    ----------
+    app : Flask
+        The app to warm up
+    """
+    start = time.time()
+
+    # The app can serve without warming up, so a failure here, such as the
+    # database not being reachable yet, must not stop it starting
+    try:
+        env = app.jinja_env
+        for name in env.list_templates(
+                filter_func=lambda n: n.endswith('.html')):
+            env.get_template(name)
+
+        with app.test_request_context():
+            urls = [url_for('leagues')]
+            for league in League.query.all():
+                urls.append(url_for('league_overall', id=league.id))
+                round = current_round(league)
+                if round is not None:
+                    urls.append(url_for('round', id=round.id))
+            db.session.remove()
+
+        client = app.test_client()
+        for url in urls:
+            response = client.get(url)
+            response.get_data()
+            if response.status_code != 200:
+                app.logger.warning('Warming up %s gave status %d', url,
+                                   response.status_code)
+    except Exception:
+        app.logger.exception('Failed to warm up, starting without it')
+        return
+    finally:
+        db.engine.dispose()
+
+    app.logger.info('Warmed up %d pages in %.2fs', len(urls),
+                    time.time() - start)
@@ -0,0 +1,11 @@
+"""
+The WSGI entry point, e.g. for gunicorn -c gunicorn.conf.py
+showmanager.wsgi:app
+"""
+from .app import create_app
+from .warmup import warm_up
+
+app = create_app()
+
+if app.config['WARM_UP']:
+    warm_up(app)
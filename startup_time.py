@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Measure how long a new process takes to start serving, and its memory use.
+
+Each run starts a fresh Python process, as a worker respawn or a command
+line tool would, and times each stage of starting up:
+
+    ./startup_time.py [--runs N]
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# Run in the child process, printing the cumulative time after each stage
+CHILD = '''
+import json, resource, time
+start = time.perf_counter()
+times = {}
+
+def stage(name):
+    times[name] = time.perf_counter() - start
+
+import showmanager.app
+stage('import app')
+import showmanager.models
+stage('import models')
+from showmanager.app import create_app
+app = create_app()
+stage('create_app')
+client = app.test_client()
+client.get('/').get_data()
+stage('first request')
+
+# Peak resident memory, in kilobytes on Linux
+memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({'times': times, 'memory': memory}))
+'''
+
+
+def measure():
+    """
+    Start a process and time its stages.
+
+    Returns
+    -------
+    dict
+        The cumulative time of each stage, in seconds, and the peak memory
+    """
+    output = subprocess.check_output([sys.executable, '-c', CHILD])
+    return json.loads(output.decode('utf-8').splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--runs', type=int, default=5,
+                        help='the number of processes to time')
+    args = parser.parse_args()
+
+    results = [measure() for _ in range(args.runs)]
+
+    print('Median over {} runs:'.format(args.runs))
+    for name in results[0]['times']:
+        median = statistics.median(r['times'][name] for r in results)
+        print('  {:<15} {:7.1f} ms'.format(name, median * 1000))
+    memory = statistics.median(r['memory'] for r in results)
+    print('  {:<15} {:7.1f} MB'.format('peak memory', memory / 1024))
+
+
+if __name__ == '__main__':
+    main()
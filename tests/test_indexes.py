@@ -0,0 +1,50 @@
+"""
+Check that the main lookups of the pages search their indexes.
+"""
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from showmanager.app import db
+from showmanager.models import Course, Entry, Round, Score
+
+
+@pytest.fixture(scope='module')
+def engine():
+    engine = create_engine('sqlite://')
+    db.metadata.create_all(engine)
+    return engine
+
+
+def query_plan(engine, query):
+    """
+    Get the details of each step of SQLite's plan for a query.
+    """
+    sql = query.compile(dialect=engine.dialect,
+                        compile_kwargs={'literal_binds': True})
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN {}'.format(sql))
+        return [row[-1] for row in rows]
+
+
+@pytest.mark.parametrize('query, index', [
+    # The latest score change on a course, for results versions
+    (select([func.max(Score.modified)]).where(Score.course_id == 1),
+     'ix_scores_course_modified'),
+    # The entries of a league, by handler
+    (select([Entry.id]).where(Entry.league_id == 1).order_by(Entry.handler),
+     'ix_entries_league_handler'),
+    # The rounds of a league, by date
+    (select([Round.id]).where(Round.league_id == 1).order_by(Round.date),
+     'ix_rounds_league_date'),
+    # The courses of a round
+    (select([Course.id]).where(Course.round_id == 1),
+     'ix_courses_round'),
+    # The courses of a class
+    (select([Course.id]).where(Course.class_id == 1),
+     'ix_courses_class'),
+])
+def test_index_used(engine, query, index):
+    plan = query_plan(engine, query)
+    assert any('SEARCH' in step and index in step for step in plan), plan
+    assert not any('TEMP B-TREE' in step for step in plan), plan